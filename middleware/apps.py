@@ -7,4 +7,7 @@ class MiddlewareConfig(AppConfig):
     verbose_name = "Middleware"
 
     def ready(self):
+        # connects the signal receivers of the asset registry
+        import middleware.assets  # noqa: F401
+
         cache.clear()
@@ -8,19 +8,25 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
 
 import os
+import threading
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
-from middleware.authentication import TokenAuthMiddlewareStack
-from middleware.urls import websocket_urlpatterns
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "middleware.settings")
 
-
+# the app registry has to be populated before anything importing models loads
 django_asgi_app = get_asgi_application()
 
+from middleware.authentication import TokenAuthMiddlewareStack  # noqa: E402
+from middleware.camera.pool import camera_controller_pool  # noqa: E402
+from middleware.urls import websocket_urlpatterns  # noqa: E402
+
+if settings.CAMERA_POOL_WARM_ON_STARTUP:
+    threading.Thread(target=camera_controller_pool.warm, daemon=True).start()
+
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
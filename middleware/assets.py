@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+from uuid import UUID, uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from middleware.models import Asset
+
+logger = logging.getLogger(__name__)
+
+ASSET_REGISTRY_VERSION_KEY = "assets:version"
+
+
+class AssetSnapshot:
+    """
+    The active assets at one point in time, indexed by id, ip address and type
+    """
+
+    def __init__(self, version: str, assets: List[Asset]):
+        self.version = version
+        self.assets = assets
+        self.by_id: Dict[UUID, Asset] = {asset.id: asset for asset in assets}
+        self.by_ip: Dict[str, Asset] = {}
+        self.by_type: Dict[str, List[Asset]] = {}
+        for asset in assets:
+            self.by_ip.setdefault(asset.ip_address, asset)
+            self.by_type.setdefault(asset.type, []).append(asset)
+
+
+class AssetRegistry:
+    """
+    Process local cache of the active assets for the hot paths.
+
+    The assets change at most once a sync, so the registry only checks the
+    version of the assets in the cache on a lookup and reloads them from the
+    database when the version was bumped by `invalidate`. The returned assets
+    are shared, callers must not modify them.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[AssetSnapshot] = None
+        self._lock = threading.Lock()
+
+    def get_snapshot(self) -> AssetSnapshot:
+        version = cache.get_or_set(
+            ASSET_REGISTRY_VERSION_KEY, lambda: uuid4().hex, timeout=None
+        )
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = AssetSnapshot(
+                        version,
+                        list(Asset.objects.filter(deleted=False).order_by("id")),
+                    )
+                    self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        cache.set(ASSET_REGISTRY_VERSION_KEY, uuid4().hex, timeout=None)
+
+    def all(self) -> List[Asset]:
+        return self.get_snapshot().assets
+
+    def get(self, asset_id: UUID) -> Optional[Asset]:
+        try:
+            return self.get_snapshot().by_id.get(UUID(str(asset_id)))
+        except ValueError:
+            return None
+
+    def get_by_ip(self, ip_address: str) -> Optional[Asset]:
+        return self.get_snapshot().by_ip.get(ip_address)
+
+    def filter_by_type(self, asset_type: str) -> List[Asset]:
+        return self.get_snapshot().by_type.get(asset_type, [])
+
+
+asset_registry = AssetRegistry()
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def invalidate_asset_registry(**kwargs):
+    # edits outside of the sync, e.g. through the admin, bumped once committed
+    # so no process can cache the old rows under the new version
+    transaction.on_commit(asset_registry.invalidate)
+
+
+def get_asset_config_hash(config: Dict) -> str:
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def sync_assets(configs: List[Dict]) -> List[UUID]:
+    """
+    Sync the assets with their configs fetched from CARE, writing only the
+    assets that were added, changed or removed since the last sync.
+
+    Returns the ids of the assets that were written.
+    """
+    fetched = {UUID(str(config["id"])): config for config in configs}
+    existing_assets = {
+        asset.id: asset for asset in Asset.objects.only("id", "config_hash", "deleted")
+    }
+    field_names = {field.attname for field in Asset._meta.concrete_fields}
+
+    created, updated, updated_fields = [], [], {"config_hash", "updated_at"}
+    for asset_id, config in fetched.items():
+        config_hash = get_asset_config_hash(config)
+        asset = existing_assets.get(asset_id)
+        if asset is not None and asset.config_hash == config_hash:
+            continue
+        fields = {
+            field: value
+            for field, value in config.items()
+            if field != "id" and field in field_names
+        }
+        if asset is None:
+            created.append(Asset(id=asset_id, config_hash=config_hash, **fields))
+            continue
+        for field, value in fields.items():
+            setattr(asset, field, value)
+        asset.config_hash = config_hash
+        asset.updated_at = timezone.now()
+        updated.append(asset)
+        updated_fields.update(fields)
+
+    missing_asset_ids = [
+        asset.id
+        for asset_id, asset in existing_assets.items()
+        if asset_id not in fetched and not asset.deleted
+    ]
+
+    if not (missing_asset_ids or created or updated):
+        return []
+
+    with transaction.atomic():
+        if missing_asset_ids:
+            Asset.objects.filter(id__in=missing_asset_ids).delete()
+        if created:
+            Asset.objects.bulk_create(created)
+        if updated:
+            Asset.objects.bulk_update(updated, sorted(updated_fields))
+        transaction.on_commit(asset_registry.invalidate)
+
+    logger.info(
+        "Synced assets, created: %s, updated: %s, deleted: %s",
+        len(created),
+        len(updated),
+        len(missing_asset_ids),
+    )
+    return [
+        *missing_asset_ids,
+        *(asset.id for asset in created),
+        *(asset.id for asset in updated),
+    ]
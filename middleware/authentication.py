@@ -1,7 +1,6 @@
 import logging
 
 import jwt
-import requests
 from channels.auth import AuthMiddlewareStack
 from channels.exceptions import DenyConnection
 from channels.middleware import BaseMiddleware
@@ -14,6 +13,8 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 from rest_framework_simplejwt.tokens import Token
 
+from middleware.care import care_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -48,7 +49,7 @@ class CareAuthentication(JWTAuthentication):
     def get_public_key(self, url):
         public_key_json = cache.get(jwk_response_cache_key(url))
         if not public_key_json:
-            res = requests.get(url)
+            res = care_client.get(url)
             res.raise_for_status()
             public_key_json = res.json()
             cache.set(jwk_response_cache_key(url), public_key_json, timeout=60 * 5)
@@ -8,6 +8,12 @@ class InvalidCameraCredentialsException(APIException):
     default_code = "camera_error"
 
 
+class CameraMoveTimeoutException(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = "Camera movement did not complete in time"
+    default_code = "camera_error"
+
+
 class CameraLockedException(APIException):
     status_code = status.HTTP_423_LOCKED
     default_detail = "Camera is Locked"
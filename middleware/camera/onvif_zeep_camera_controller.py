@@ -1,12 +1,12 @@
 import logging
 
-from django.conf import settings
-from onvif import ONVIFCamera, ONVIFError
+from onvif import ONVIFError
 
 from middleware.camera.abstract_camera import AbstractCameraController
 from middleware.camera.exceptions import InvalidCameraCredentialsException
 from middleware.camera.types import CameraAsset
 from middleware.camera.utils import wait_for_movement_completion
+from middleware.camera.wsdl import CachedONVIFCamera
 
 logger = logging.getLogger(__name__)
 
@@ -14,9 +14,7 @@ logger = logging.getLogger(__name__)
 class OnvifZeepCameraController(AbstractCameraController):
     def __init__(self, req: CameraAsset) -> None:
         try:
-            cam = ONVIFCamera(
-                req.hostname, req.port, req.username, req.password, settings.WSDL_PATH
-            )
+            cam = CachedONVIFCamera(req.hostname, req.port, req.username, req.password)
         except ONVIFError as err:
             logger.debug(
                 "Exception raised while connecting to Camera with req: %s and reason: %s",
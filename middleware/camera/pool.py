@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from django.conf import settings
+from onvif import ONVIFError
+from zeep.exceptions import Error as ZeepError
+
+from middleware.assets import asset_registry
+from middleware.camera.exceptions import InvalidCameraCredentialsException
+from middleware.camera.onvif_zeep_camera_controller import OnvifZeepCameraController
+from middleware.camera.types import CameraAsset
+from middleware.models import Asset, AssetClasses
+
+logger = logging.getLogger(__name__)
+
+CameraKey = Tuple[str, int, str]
+
+# the failures meaning the connection to the camera is no longer usable
+CAMERA_CONNECTION_ERRORS = (
+    ONVIFError,
+    ZeepError,
+    requests.RequestException,
+    InvalidCameraCredentialsException,
+)
+
+
+def get_camera_asset(camera: Asset) -> CameraAsset:
+    return CameraAsset(
+        hostname=str(camera.ip_address),
+        port=int(camera.port),
+        username=str(camera.username),
+        password=str(camera.password),
+    )
+
+
+class PooledController:
+    def __init__(self, controller: OnvifZeepCameraController, password: str):
+        self.controller = controller
+        self.password = password
+        self.last_used = time.monotonic()
+
+
+class CameraControllerPool:
+    """
+    Process wide pool of camera controllers keyed by (hostname, port, username).
+
+    Building a controller loads the WSDLs, creates the media and PTZ services
+    and fetches the profiles of the camera, so it is done once per camera and
+    reused. A controller is rebuilt when it was idle for
+    CAMERA_POOL_IDLE_TIMEOUT, or it fails the health check done when it was
+    unused for CAMERA_POOL_VALIDATE_AFTER. Callers invalidate the controller
+    of a camera when a command on it fails with a connection error.
+
+    A request with another password than the pooled controller gets a
+    controller of its own. Connecting fetches the profiles of the camera,
+    which only succeeds with the credentials the camera accepts, so a wrong
+    password fails without touching the pooled controller, while a rotated
+    one connects and replaces it.
+    """
+
+    def __init__(self):
+        self._controllers: Dict[CameraKey, PooledController] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(req: CameraAsset) -> CameraKey:
+        return (req.hostname, int(req.port), req.username)
+
+    def get(self, req: CameraAsset) -> OnvifZeepCameraController:
+        key = self.get_key(req)
+        self.evict_idle()
+        with self._lock:
+            pooled = self._controllers.get(key)
+        if pooled is not None and pooled.password != req.password:
+            logger.debug("Password differs from the pooled one for camera: %s", key)
+            pooled = None
+        if (
+            pooled is not None
+            and time.monotonic() - pooled.last_used
+            > settings.CAMERA_POOL_VALIDATE_AFTER
+            and not self.is_healthy(pooled.controller)
+        ):
+            self.invalidate(req)
+            pooled = None
+        if pooled is None:
+            # built outside of the lock, a slow camera must not block the
+            # others, and only pooled once it connected
+            built = PooledController(
+                OnvifZeepCameraController(req=req), password=req.password
+            )
+            with self._lock:
+                pooled = self._controllers.get(key)
+                if pooled is None or pooled.password != req.password:
+                    pooled = self._controllers[key] = built
+        pooled.last_used = time.monotonic()
+        return pooled.controller
+
+    def is_healthy(self, controller: OnvifZeepCameraController) -> bool:
+        try:
+            controller.get_status()
+            return True
+        except Exception as err:
+            logger.debug("Pooled camera controller failed health check: %s", err)
+            return False
+
+    def invalidate(self, req: CameraAsset):
+        """
+        Drop the pooled controller of the camera, unless it was pooled with
+        another password than the failed request's
+        """
+        key = self.get_key(req)
+        with self._lock:
+            pooled = self._controllers.get(key)
+            if pooled is not None and pooled.password == req.password:
+                del self._controllers[key]
+
+    def evict_idle(self):
+        deadline = time.monotonic() - settings.CAMERA_POOL_IDLE_TIMEOUT
+        with self._lock:
+            for key in [
+                key
+                for key, pooled in self._controllers.items()
+                if pooled.last_used < deadline
+            ]:
+                del self._controllers[key]
+
+    def clear(self):
+        with self._lock:
+            self._controllers.clear()
+
+    def warm(self, cameras: Optional[List[Asset]] = None):
+        """
+        Build the controllers of the ONVIF assets, so the first command to a
+        camera does not pay for the connection.
+        """
+        if cameras is None:
+            cameras = asset_registry.filter_by_type(AssetClasses.ONVIF.name)
+
+        def connect(camera):
+            try:
+                self.get(get_camera_asset(camera))
+            except Exception as err:
+                logger.warning(
+                    "Failed to connect to Camera having id: %s, reason: %s",
+                    camera.id,
+                    err,
+                )
+
+        with ThreadPoolExecutor(
+            max_workers=settings.CAMERA_STATUS_CONCURRENCY
+        ) as executor:
+            list(executor.map(connect, cameras))
+        logger.info("Warmed camera controllers for %s cameras", len(cameras))
+
+
+camera_controller_pool = CameraControllerPool()
@@ -1,13 +1,38 @@
+import json
+from threading import Event
 from unittest import TestCase as UnitTest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from middleware.camera.exceptions import InvalidCameraCredentialsException
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.test import override_settings
+from onvif import ONVIFError
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APIRequestFactory
+
+from middleware.camera.exceptions import (
+    CameraLockedException,
+    CameraMoveTimeoutException,
+    InvalidCameraCredentialsException,
+)
 from middleware.camera.onvif_zeep_camera_controller import OnvifZeepCameraController
+from middleware.camera.pool import CameraControllerPool
 from middleware.camera.types import CameraAsset
+from middleware.camera.utils import (
+    async_wait_for_movement,
+    notify_movement_completion,
+    set_movement_loop,
+    wait_for_movement,
+)
+from middleware.camera.views import CameraViewSet
+from middleware.camera.wsdl import create_zeep_client
+from middleware.urls import websocket_urlpatterns
 
 
 class TestOnvifZeepCameraController(UnitTest):
-    @patch("middleware.camera.onvif_zeep_camera_controller.ONVIFCamera")
+    @patch("middleware.camera.onvif_zeep_camera_controller.CachedONVIFCamera")
     def setUp(self, mocked_onvif_camera):
         # Mock the ONVIFCamera and its services
         self.mock_camera = mocked_onvif_camera.return_value
@@ -108,3 +133,235 @@ class CameraExceptions(UnitTest):
             InvalidCameraCredentialsException, "Invalid Credentials"
         ):
             OnvifZeepCameraController(self.req)
+
+
+class TestCameraControllerPool(UnitTest):
+    def setUp(self):
+        self.req = CameraAsset(
+            hostname="192.168.1.10", port=80, username="user", password="pass"
+        )
+
+    @patch("middleware.camera.pool.OnvifZeepCameraController")
+    def test_controllers_are_reused(self, mock_controller):
+        mock_controller.side_effect = lambda req: MagicMock()
+        pool = CameraControllerPool()
+
+        controller = pool.get(self.req)
+        self.assertIs(controller, pool.get(self.req))
+        self.assertEqual(1, mock_controller.call_count)
+
+        pool.invalidate(self.req)
+        self.assertIsNot(controller, pool.get(self.req))
+        self.assertEqual(2, mock_controller.call_count)
+
+    @patch("middleware.camera.pool.OnvifZeepCameraController")
+    def test_wrong_password_does_not_replace_controller(self, mock_controller):
+        mock_controller.side_effect = lambda req: MagicMock()
+        pool = CameraControllerPool()
+        controller = pool.get(self.req)
+
+        wrong = self.req.model_copy(update={"password": "wrong"})
+        mock_controller.side_effect = InvalidCameraCredentialsException
+        with self.assertRaises(InvalidCameraCredentialsException):
+            pool.get(wrong)
+        pool.invalidate(wrong)
+        self.assertIs(controller, pool.get(self.req))
+
+        mock_controller.side_effect = InvalidCameraCredentialsException
+        pool.invalidate(self.req)
+        with self.assertRaises(InvalidCameraCredentialsException):
+            pool.get(self.req)
+        self.assertEqual({}, pool._controllers)
+
+    @patch("middleware.camera.pool.OnvifZeepCameraController")
+    def test_rotated_password_replaces_controller(self, mock_controller):
+        mock_controller.side_effect = lambda req: MagicMock()
+        pool = CameraControllerPool()
+        controller = pool.get(self.req)
+
+        rotated = self.req.model_copy(update={"password": "rotated"})
+        rotated_controller = pool.get(rotated)
+
+        self.assertIsNot(controller, rotated_controller)
+        self.assertIs(rotated_controller, pool.get(rotated))
+        self.assertEqual(2, mock_controller.call_count)
+
+    @patch("middleware.camera.views.camera_controller_pool")
+    def test_only_connection_errors_invalidate(self, mock_pool):
+        view = CameraViewSet()
+        view.camera_request = self.req
+        view.request = MagicMock()
+        view.args, view.kwargs = (), {}
+
+        for exc in (CameraMoveTimeoutException(), NotFound(), CameraLockedException()):
+            view.handle_exception(exc)
+        mock_pool.invalidate.assert_not_called()
+
+        with self.assertRaises(ONVIFError):
+            view.handle_exception(ONVIFError("camera is down"))
+        mock_pool.invalidate.assert_called_once_with(self.req)
+
+    @patch("middleware.camera.pool.OnvifZeepCameraController")
+    def test_idle_controllers_are_revalidated(self, mock_controller):
+        mock_controller.side_effect = lambda req: MagicMock()
+        pool = CameraControllerPool()
+
+        controller = pool.get(self.req)
+        controller.get_status.side_effect = ConnectionError("camera restarted")
+        with override_settings(CAMERA_POOL_VALIDATE_AFTER=-1):
+            self.assertIsNot(controller, pool.get(self.req))
+        with override_settings(CAMERA_POOL_IDLE_TIMEOUT=-1):
+            pool.evict_idle()
+        self.assertEqual({}, pool._controllers)
+
+
+def move_status(pan_tilt, zoom="IDLE"):
+    status = MagicMock()
+    status.MoveStatus.PanTilt = pan_tilt
+    status.MoveStatus.Zoom = zoom
+    return status
+
+
+class TestMovementCompletion(UnitTest):
+    def setUp(self):
+        self.controller = MagicMock()
+        poll_intervals = override_settings(
+            CAMERA_MOVE_POLL_MIN_INTERVAL=0.01, CAMERA_MOVE_POLL_MAX_INTERVAL=0.02
+        )
+        poll_intervals.enable()
+        self.addCleanup(poll_intervals.disable)
+
+    def test_wait_for_movement(self):
+        self.controller.camera_ptz.GetStatus.side_effect = [
+            move_status("MOVING"),
+            move_status("MOVING", "MOVING"),
+            move_status("IDLE"),
+        ]
+        self.assertTrue(wait_for_movement(self.controller))
+        self.assertEqual(3, self.controller.camera_ptz.GetStatus.call_count)
+
+    def test_wait_for_movement_is_bounded(self):
+        self.controller.camera_ptz.GetStatus.return_value = move_status("MOVING")
+        with self.assertRaises(CameraMoveTimeoutException):
+            wait_for_movement(self.controller, timeout=0.05)
+
+        cancel = Event()
+        cancel.set()
+        self.assertFalse(wait_for_movement(self.controller, cancel=cancel))
+
+    def test_async_wait_for_movement(self):
+        self.controller.camera_ptz.GetStatus.side_effect = [
+            move_status("MOVING"),
+            move_status("IDLE"),
+        ]
+        async_to_sync(async_wait_for_movement)(self.controller)
+        self.assertEqual(2, self.controller.camera_ptz.GetStatus.call_count)
+
+        self.controller.camera_ptz.GetStatus.side_effect = None
+        self.controller.camera_ptz.GetStatus.return_value = move_status("MOVING")
+        with self.assertRaises(CameraMoveTimeoutException):
+            async_to_sync(async_wait_for_movement)(self.controller, timeout=0.05)
+
+
+class TestWsdlCache(UnitTest):
+    def test_clients_share_the_parsed_wsdl(self):
+        wsdl_file = str(settings.WSDL_PATH / "ptz.wsdl")
+        first = create_zeep_client(wsdl_file, "user", "pass")
+        second = create_zeep_client(wsdl_file, "other", "secret")
+
+        self.assertIs(first.wsdl, second.wsdl)
+        self.assertIs(first.transport, second.transport)
+        self.assertIsNot(first.wsse, second.wsse)
+
+
+class TestMovementNotifications(UnitTest):
+    def setUp(self):
+        self.controller = MagicMock()
+        self.controller.camera_ptz.GetStatus.return_value = move_status("IDLE")
+        self.addCleanup(set_movement_loop, None)
+
+    def test_completion_is_delivered_to_the_websocket(self):
+        async def run():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), "cameras/10.0.0.1/movements"
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            # from a request thread, as the camera views are sync
+            await sync_to_async(notify_movement_completion)(self.controller, "10.0.0.1")
+            message = json.loads(await communicator.receive_from(timeout=3))
+            await communicator.disconnect()
+            return message
+
+        self.assertEqual({"status": "completed"}, async_to_sync(run)())
+
+    @patch("middleware.camera.utils.get_channel_layer")
+    def test_completion_without_server_loop(self, mock_get_channel_layer):
+        mock_get_channel_layer.return_value.group_send = AsyncMock()
+        set_movement_loop(None)
+
+        notify_movement_completion(self.controller, "10.0.0.1").result(timeout=3)
+
+        mock_get_channel_layer.return_value.group_send.assert_awaited_once_with(
+            "camera_movements_10.0.0.1",
+            {"type": "send_movement", "status": "completed"},
+        )
+
+    @patch("middleware.camera.views.notify_movement_completion")
+    @patch("middleware.camera.views.is_camera_locked", return_value=None)
+    @patch("middleware.camera.views.camera_controller_pool")
+    def test_go_to_preset_without_waiting(
+        self, mock_pool, mock_is_camera_locked, mock_notify_movement_completion
+    ):
+        mock_pool.get.return_value.go_to_preset.return_value = "Preset1"
+        request = APIRequestFactory().post(
+            "/gotoPreset",
+            {
+                "hostname": "10.0.0.1",
+                "port": 80,
+                "username": "user",
+                "password": "pass",
+                "preset": 0,
+                "wait": False,
+            },
+            format="json",
+        )
+
+        response = CameraViewSet.as_view({"post": "go_to_preset"})(request)
+
+        self.assertEqual(202, response.status_code)
+        mock_pool.get.return_value.go_to_preset.assert_called_once_with(
+            preset_id=0, wait=False
+        )
+        mock_notify_movement_completion.assert_called_once_with(
+            mock_pool.get.return_value, "10.0.0.1"
+        )
+
+    @patch("middleware.camera.views.notify_movement_completion")
+    @patch("middleware.camera.views.is_camera_locked", return_value=True)
+    @patch("middleware.camera.views.camera_controller_pool")
+    def test_locked_camera_is_not_moved(
+        self, mock_pool, mock_is_camera_locked, mock_notify_movement_completion
+    ):
+        payload = {
+            "hostname": "10.0.0.1",
+            "port": 80,
+            "username": "user",
+            "password": "pass",
+            "wait": False,
+        }
+        for action, url, extra in (
+            ("go_to_preset", "/gotoPreset", {"preset": 0}),
+            ("absolute_move", "/absoluteMove", {"x": 0.1, "y": 0.1, "zoom": 0}),
+            ("relative_move", "/relativeMove", {"x": 0.1, "y": 0.1, "zoom": 0}),
+        ):
+            with self.subTest(action=action):
+                request = APIRequestFactory().post(
+                    url, {**payload, **extra}, format="json"
+                )
+
+                response = CameraViewSet.as_view({"post": action})(request)
+
+                self.assertEqual(423, response.status_code)
+        mock_pool.get.assert_not_called()
+        mock_notify_movement_completion.assert_not_called()
@@ -17,12 +17,16 @@ class CameraAssetPresetRequest(CameraAsset):
     preset: int = Field(
         default=None, validation_alias=AliasChoices("preset", "presetName")
     )
+    # when false, reply once the move started and report its end over the
+    # camera movements websocket
+    wait: bool = True
 
 
 class CameraAssetMoveRequest(CameraAsset):
     x: float
     y: float
     zoom: float
+    wait: bool = True
 
 
 class CameraStatus:
@@ -1,11 +1,17 @@
+import asyncio
 import functools
 import logging
-from time import sleep
+import threading
+import time
+from typing import Optional
 
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
 from django.conf import settings
 from django.core.cache import cache
 from drf_spectacular.utils import OpenApiParameter
 
+from middleware.camera.exceptions import CameraMoveTimeoutException
 from middleware.observation.types import DeviceID
 
 logger = logging.getLogger(__name__)
@@ -24,23 +30,78 @@ cam_params = [
 ]
 
 
+def is_movement_complete(controller) -> bool:
+    status = controller.camera_ptz.GetStatus(
+        {"ProfileToken": controller.camera_media_profile.token}
+    )
+    return status.MoveStatus.PanTilt == "IDLE" and status.MoveStatus.Zoom == "IDLE"
+
+
+def get_movement_poll_intervals():
+    """
+    Secs to wait between two status polls, short at first as most moves are
+    small, backing off up to the max for long moves
+    """
+    interval = settings.CAMERA_MOVE_POLL_MIN_INTERVAL
+    while True:
+        yield interval
+        interval = min(interval * 2, settings.CAMERA_MOVE_POLL_MAX_INTERVAL)
+
+
+def wait_for_movement(
+    controller,
+    timeout: Optional[float] = None,
+    cancel: Optional[threading.Event] = None,
+) -> bool:
+    """
+    Wait until the camera reports both pan/tilt and zoom as IDLE.
+
+    Returns False when cancelled through `cancel`, raises
+    CameraMoveTimeoutException when the move is not over within `timeout`
+    secs, CAMERA_MOVE_TIMEOUT by default.
+    """
+    cancel = cancel or threading.Event()
+    deadline = time.monotonic() + (timeout or settings.CAMERA_MOVE_TIMEOUT)
+    for interval in get_movement_poll_intervals():
+        if is_movement_complete(controller):
+            logger.info("Movement completed.")
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise CameraMoveTimeoutException
+        if cancel.wait(min(interval, remaining)):
+            return False
+
+
+async def async_wait_for_movement(controller, timeout: Optional[float] = None):
+    """
+    Async variant of `wait_for_movement`, only a status poll runs in a thread
+    and the waits between polls do not hold one. Cancel by cancelling the
+    task awaiting it.
+    """
+    deadline = time.monotonic() + (timeout or settings.CAMERA_MOVE_TIMEOUT)
+    poll = sync_to_async(is_movement_complete, thread_sensitive=False)
+    for interval in get_movement_poll_intervals():
+        if await poll(controller):
+            logger.info("Movement completed.")
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise CameraMoveTimeoutException
+        await asyncio.sleep(min(interval, remaining))
+
+
 def wait_for_movement_completion(func):
+    """
+    Wait for the movement started by the command to be over, pass
+    `wait=False` to return right after the camera accepted the command
+    """
+
     @functools.wraps(func)
-    def wrapper_wait_for_movement_completion(self, *args, **kwargs):
+    def wrapper_wait_for_movement_completion(self, *args, wait=True, **kwargs):
         response = func(self, *args, **kwargs)
-
-        # Poll the status of the camera's movement
-        while True:
-            status = self.camera_ptz.GetStatus(
-                {"ProfileToken": self.camera_media_profile.token}
-            )
-            # Assuming 'Moving' is a boolean attribute indicating movement status
-            if status.MoveStatus.PanTilt == "IDLE" and status.MoveStatus.Zoom == "IDLE":
-                logger.info("Movement completed.")
-                break
-
-            # Sleep for a short period before checking the status again
-            sleep(0.5)
+        if wait:
+            wait_for_movement(self)
         return response
 
     return wrapper_wait_for_movement_completion
@@ -56,3 +117,67 @@ def unlock_camera(ip: DeviceID):
 
 def is_camera_locked(ip: DeviceID):
     return cache.get(f"{settings.CAMERA_LOCK_KEY}{ip}")
+
+
+def get_movement_group_name(ip: DeviceID) -> str:
+    return f"camera_movements_{ip}"
+
+
+# the event loop of the server running the movements websockets
+_server_loop: Optional[asyncio.AbstractEventLoop] = None
+# fallback loop of a background thread, for processes without websockets
+_movement_loop: Optional[asyncio.AbstractEventLoop] = None
+_movement_loop_lock = threading.Lock()
+# the watches scheduled, referenced until they are done
+_movement_watches = set()
+
+
+def set_movement_loop(loop: asyncio.AbstractEventLoop):
+    global _server_loop
+    _server_loop = loop
+
+
+def get_movement_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the long lived loop to watch the movements on. It is the loop of the
+    server running the movements websockets when this process has one, so
+    the completion reaches them through any channel layer, the in memory one
+    included, and otherwise the loop of a background thread.
+    """
+    global _movement_loop
+    if _server_loop is not None and _server_loop.is_running():
+        return _server_loop
+    with _movement_loop_lock:
+        if _movement_loop is None:
+            _movement_loop = asyncio.new_event_loop()
+            threading.Thread(target=_movement_loop.run_forever, daemon=True).start()
+        return _movement_loop
+
+
+async def watch_movement(controller, ip: DeviceID):
+    try:
+        await async_wait_for_movement(controller)
+        status = "completed"
+    except CameraMoveTimeoutException:
+        status = "timeout"
+    except Exception as err:
+        logger.warning("Failed to watch movement of camera: %s, reason: %s", ip, err)
+        status = "failed"
+    await get_channel_layer().group_send(
+        get_movement_group_name(ip),
+        {"type": "send_movement", "status": status},
+    )
+
+
+def notify_movement_completion(controller, ip: DeviceID):
+    """
+    Report the end of the movement of the camera to the clients listening on
+    its movements websocket, without waiting for it. The watch runs on a long
+    lived loop, so it outlives the request without holding a thread.
+    """
+    watch = asyncio.run_coroutine_threadsafe(
+        watch_movement(controller, ip), get_movement_loop()
+    )
+    _movement_watches.add(watch)
+    watch.add_done_callback(_movement_watches.discard)
+    return watch
@@ -2,6 +2,7 @@ import logging
 
 from django.conf import settings
 from drf_spectacular.utils import extend_schema
+from pydantic import ValidationError
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -11,6 +12,7 @@ from middleware.camera.exceptions import (
     InvalidCameraCredentialsException,
 )
 from middleware.camera.onvif_zeep_camera_controller import OnvifZeepCameraController
+from middleware.camera.pool import CAMERA_CONNECTION_ERRORS, camera_controller_pool
 from middleware.camera.types import (
     CameraAsset,
     CameraAssetMoveRequest,
@@ -20,9 +22,13 @@ from middleware.camera.types import (
     SanpshotResponse,
     StatusResponseModel,
 )
-from middleware.camera.utils import cam_params, is_camera_locked
+from middleware.camera.utils import (
+    cam_params,
+    is_camera_locked,
+    notify_movement_completion,
+)
 from middleware.redis_manager import redis_manager
-from middleware.types import StatusResponse
+from middleware.types import StatusRangeRequest, StatusResponse, status_range_params
 
 logger = logging.getLogger(__name__)
 
@@ -84,12 +90,15 @@ class CameraViewSet(viewsets.ViewSet):
     @action(detail=False, methods=["post"], url_path="gotoPreset")
     def go_to_preset(self, request):
         cam_request = CameraAssetPresetRequest.model_validate(request.data)
-        self.check_camera_state(device_id=cam_request.hostname, raise_error=True)
+        self._check_camera_state(device_id=cam_request.hostname, raise_error=True)
         cam: OnvifZeepCameraController = self.get_camera_controller(cam_request)
-        response = cam.go_to_preset(preset_id=cam_request.preset)
+        response = cam.go_to_preset(preset_id=cam_request.preset, wait=cam_request.wait)
         if not response:
             response = f"Preset {cam_request.preset} Not Found"
             return Response(response, status=status.HTTP_404_NOT_FOUND)
+        if not cam_request.wait:
+            notify_movement_completion(cam, cam_request.hostname)
+            return Response(response, status=status.HTTP_202_ACCEPTED)
         return Response(response, status=status.HTTP_200_OK)
 
     @extend_schema(
@@ -100,14 +109,16 @@ class CameraViewSet(viewsets.ViewSet):
     @action(detail=False, methods=["post"], url_path="absoluteMove")
     def absolute_move(self, request):
         cam_request = CameraAssetMoveRequest.model_validate(request.data)
-        self.return_if_camera_locked(device_id=cam_request.hostname, raise_error=True)
+        self._check_camera_state(device_id=cam_request.hostname, raise_error=True)
 
         cam: OnvifZeepCameraController = self.get_camera_controller(cam_request)
-        cam.absolute_move(pan=cam_request.x, tilt=cam_request.y, zoom=cam_request.zoom)
-        return Response(
-            {"status": "success", "message": "Camera position updated!"},
-            status=status.HTTP_200_OK,
+        cam.absolute_move(
+            pan=cam_request.x,
+            tilt=cam_request.y,
+            zoom=cam_request.zoom,
+            wait=cam_request.wait,
         )
+        return self.get_movement_response(cam, cam_request)
 
     @extend_schema(
         request=CameraAssetMoveRequest,
@@ -117,14 +128,16 @@ class CameraViewSet(viewsets.ViewSet):
     @action(detail=False, methods=["post"], url_path="relativeMove")
     def relative_move(self, request):
         cam_request = CameraAssetMoveRequest.model_validate(request.data)
-        self.return_if_camera_locked(device_id=cam_request.hostname, raise_error=True)
+        self._check_camera_state(device_id=cam_request.hostname, raise_error=True)
 
         cam: OnvifZeepCameraController = self.get_camera_controller(cam_request)
-        cam.relative_move(pan=cam_request.x, tilt=cam_request.y, zoom=cam_request.zoom)
-        return Response(
-            {"status": "success", "message": "Camera position updated!"},
-            status=status.HTTP_200_OK,
+        cam.relative_move(
+            pan=cam_request.x,
+            tilt=cam_request.y,
+            zoom=cam_request.zoom,
+            wait=cam_request.wait,
         )
+        return self.get_movement_response(cam, cam_request)
 
     @extend_schema(
         request=CameraAssetMoveRequest,
@@ -134,7 +147,7 @@ class CameraViewSet(viewsets.ViewSet):
     @action(detail=False, methods=["post"], url_path="snapshotAtLocation")
     def snapshot_at_location(self, request):
         cam_request = CameraAssetMoveRequest.model_validate(request.data)
-        self.return_if_camera_locked(device_id=cam_request.hostname, raise_error=True)
+        self._check_camera_state(device_id=cam_request.hostname, raise_error=True)
         cam: OnvifZeepCameraController = self.get_camera_controller(cam_request)
         cam.relative_move(pan=cam_request.x, tilt=cam_request.y, zoom=cam_request.zoom)
         snapshot_uri = cam.get_snapshot_uri()
@@ -144,38 +157,58 @@ class CameraViewSet(viewsets.ViewSet):
         )
 
     @extend_schema(
+        parameters=status_range_params,
         responses={200: StatusResponse},
         description="Get statuses for camera devices",
     )
     @action(detail=False, methods=["get"], url_path="cameras/status")
     def camera_statuses(self, request):
-        statuses = redis_manager.get_redis_items(settings.CAMERA_STATUS_KEY)
+        try:
+            query = StatusRangeRequest.model_validate(request.query_params.dict())
+        except ValidationError as exc:
+            return Response(
+                {"error": exc.errors(include_url=False, include_context=False)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        statuses = redis_manager.get_time_series(
+            settings.CAMERA_STATUS_KEY,
+            since=query.since,
+            until=query.until,
+            limit=query.limit,
+        )
         return Response(statuses, status=status.HTTP_200_OK)
 
+    def get_movement_response(self, cam, cam_request):
+        if not cam_request.wait:
+            notify_movement_completion(cam, cam_request.hostname)
+            return Response(
+                {"status": "success", "message": "Camera movement started!"},
+                status=status.HTTP_202_ACCEPTED,
+            )
+        return Response(
+            {"status": "success", "message": "Camera position updated!"},
+            status=status.HTTP_200_OK,
+        )
+
     def _check_camera_state(self, device_id, raise_error=False):
         state = is_camera_locked(device_id)
 
         if state and raise_error:
-            raise CameraLockedException
-
-    def return_if_camera_locked(self, device_id, raise_error=False):
-        try:
-            self._check_camera_state(device_id=device_id, raise_error=raise_error)
-        except CameraLockedException:
             logger.debug("Camera with host: %s is locked.", device_id)
-            return Response(
-                {
-                    "message": "Camera is Locked!",
-                },
-                status=status.HTTP_423_LOCKED,
-            )
+            raise CameraLockedException
 
     def get_camera_controller(self, camera_request):
+        self.camera_request = camera_request
         try:
-            return OnvifZeepCameraController(req=camera_request)
-
+            return camera_controller_pool.get(camera_request)
         except InvalidCameraCredentialsException as exc:
             logger.error("An exception occurred while getting presets: %s", exc)
-            return Response(
-                {"message": exc.default_detail}, status=status.HTTP_400_BAD_REQUEST
-            )
+            raise
+
+    def handle_exception(self, exc):
+        # the pooled controller may be stale, e.g. the camera restarted or its
+        # credentials changed, so the next request reconnects
+        camera_request = getattr(self, "camera_request", None)
+        if camera_request is not None and isinstance(exc, CAMERA_CONNECTION_ERRORS):
+            camera_controller_pool.invalidate(camera_request)
+        return super().handle_exception(exc)
@@ -0,0 +1,104 @@
+from functools import lru_cache
+
+from django.conf import settings
+from onvif import ONVIFCamera, ONVIFService
+from onvif.client import UsernameDigestTokenDtDiff
+from requests import Session
+from requests.adapters import HTTPAdapter
+from zeep import Client, Settings
+from zeep.transports import Transport
+from zeep.wsdl import Document
+
+
+@lru_cache(maxsize=None)
+def get_zeep_settings() -> Settings:
+    # the settings onvif creates its clients with
+    return Settings(strict=False, xml_huge_tree=True)
+
+
+@lru_cache(maxsize=None)
+def get_transport() -> Transport:
+    """
+    Get the zeep transport of the process, its session keeps the connections
+    to the cameras open across controllers
+    """
+    adapter = HTTPAdapter(
+        pool_connections=settings.CAMERA_STATUS_CONCURRENCY,
+        pool_maxsize=settings.CAMERA_STATUS_CONCURRENCY,
+    )
+    session = Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return Transport(
+        session=session,
+        timeout=settings.CAMERA_TIMEOUT,
+        operation_timeout=settings.CAMERA_TIMEOUT,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_wsdl_document(path: str) -> Document:
+    """
+    Parse a WSDL of the ONVIF services once per process, the parsed
+    definitions are read only and shared by every camera connection
+    """
+    return Document(path, get_transport(), settings=get_zeep_settings())
+
+
+def create_zeep_client(
+    wsdl_file: str, user: str, passwd: str, dt_diff=None, encrypt: bool = True
+) -> Client:
+    return Client(
+        wsdl=get_wsdl_document(wsdl_file),
+        wsse=UsernameDigestTokenDtDiff(
+            user, passwd, dt_diff=dt_diff, use_digest=encrypt
+        ),
+        transport=get_transport(),
+        settings=get_zeep_settings(),
+    )
+
+
+class CachedONVIFCamera(ONVIFCamera):
+    """
+    ONVIFCamera building its service clients from the parsed WSDLs and the
+    transport of the process, instead of parsing the WSDLs for every service
+    of every camera
+    """
+
+    def __init__(self, host, port, user, passwd):
+        super().__init__(
+            host,
+            port,
+            user,
+            passwd,
+            str(settings.WSDL_PATH),
+            transport=get_transport(),
+        )
+
+    def create_onvif_service(self, name, from_template=True, portType=None):
+        name = name.lower()
+        xaddr, wsdl_file, binding_name = self.get_definition(name, portType)
+        zeep_client = create_zeep_client(
+            wsdl_file, self.user, self.passwd, self.dt_diff, self.encrypt
+        )
+
+        with self.services_lock:
+            service = ONVIFService(
+                xaddr,
+                self.user,
+                self.passwd,
+                wsdl_file,
+                self.encrypt,
+                self.daemon,
+                zeep_client=zeep_client,
+                portType=portType,
+                dt_diff=self.dt_diff,
+                binding_name=binding_name,
+                transport=self.transport,
+            )
+            self.services[name] = service
+            setattr(self, name, service)
+            if not self.services_template.get(name):
+                self.services_template[name] = service
+
+        return service
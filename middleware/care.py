@@ -0,0 +1,77 @@
+import logging
+import os
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class CareClient:
+    """
+    HTTP client for every request to CARE, sharing a pooled keep-alive
+    session with timeouts and retries
+    """
+
+    def __init__(self):
+        self._session = None
+        self._session_pid = None
+
+    def get_session(self) -> requests.Session:
+        """
+        Get the session of the process, it is created lazily so forked worker
+        processes never share the connections of their parent.
+        """
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            retry = Retry(
+                total=settings.CARE_MAX_RETRIES,
+                backoff_factor=settings.CARE_RETRY_BACKOFF,
+                status_forcelist=(502, 503, 504),
+                # only idempotent requests are retried once they were sent
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=settings.CARE_POOL_SIZE,
+                pool_maxsize=settings.CARE_POOL_SIZE,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+            self._session_pid = pid
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault(
+            "timeout", (settings.CARE_CONNECT_TIMEOUT, settings.CARE_READ_TIMEOUT)
+        )
+        start = time.perf_counter()
+        status = None
+        try:
+            response = self.get_session().request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            logger.info(
+                "CARE %s %s returned %s in %.3fs",
+                method,
+                urlsplit(url).path,
+                status or "no response",
+                time.perf_counter() - start,
+            )
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+care_client = CareClient()
@@ -1,42 +1,232 @@
 import asyncio
 import json
 import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from urllib.parse import parse_qs
 
 import psutil
-from asgiref.sync import async_to_sync
 from channels.consumer import AsyncConsumer
 from channels.exceptions import StopConsumer
-from channels.generic.websocket import WebsocketConsumer
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 
+from middleware.camera.utils import get_movement_group_name, set_movement_loop
+from middleware.observation.utils import (
+    add_group_subscriber,
+    encode_json_array,
+    remove_group_subscriber,
+)
 
-class observations(WebsocketConsumer):
-    def connect(self):
+
+def get_update_interval(query: Dict[str, List[str]]) -> float:
+    """
+    Min secs between two pushes to a client, the lower of the server limit
+    and the `max_rate` asked for by the client, 0 when neither is set
+    """
+    rates = [settings.OBSERVATIONS_WS_MAX_RATE]
+    try:
+        rates.append(float(query.get("max_rate", ["0"])[0]))
+    except ValueError:
+        pass
+    rates = [rate for rate in rates if rate > 0]
+    return 1 / min(rates) if rates else 0
+
+
+class ObservationBuffer:
+    """
+    Observations pending for a throttled client, vitals are coalesced to the
+    latest value of each observation id and waveform chunks are kept in a
+    bounded ring dropping the oldest ones
+    """
+
+    def __init__(self, waveform_limit: int):
+        self.vitals: Dict[str, str] = {}
+        self.waveforms: Deque[str] = deque(maxlen=waveform_limit)
+
+    def __bool__(self):
+        return bool(self.vitals or self.waveforms)
+
+    def add(self, observations: List[List[Optional[str]]]):
+        for observation_id, fragment in observations:
+            if observation_id is None:
+                self.waveforms.append(fragment)
+            else:
+                self.vitals[observation_id] = fragment
+
+    def flush(self) -> str:
+        text = encode_json_array([*self.vitals.values(), *self.waveforms])
+        self.vitals.clear()
+        self.waveforms.clear()
+        return text
+
+
+class ThrottledConsumer(AsyncWebsocketConsumer, ABC):
+    """
+    Group consumer with per connection flow control, messages are sent as
+    they arrive unless the connection is throttled, then they are buffered
+    and flushed at most once per interval so a slow client gets merged
+    frames instead of a growing send queue. The subscription to the group is
+    kept in redis, senders skip building the messages of optional groups
+    nobody subscribed to.
+    """
+
+    @abstractmethod
+    def get_group_name(self, ip: str, query: Dict[str, List[str]]) -> str:
+        pass
+
+    @abstractmethod
+    def create_buffer(self):
+        pass
+
+    @abstractmethod
+    def buffer_message(self, event: dict):
+        pass
+
+    @abstractmethod
+    async def send_message(self, event: dict):
+        pass
+
+    @abstractmethod
+    async def send_buffer(self):
+        pass
+
+    async def connect(self):
         ip = self.scope["url_route"]["kwargs"].get("ip_address", None)
         if ip:
-            self.room_group_name = f"ip_{ip}"
-            async_to_sync(self.channel_layer.group_add)(
-                self.room_group_name, self.channel_name
-            )
+            query = parse_qs(self.scope.get("query_string", b"").decode())
+            self.interval = get_update_interval(query)
+            self.last_flush = 0.0
+            self.flush_task = None
+            self.buffer = self.create_buffer()
+            self.room_group_name = self.get_group_name(ip, query)
+            await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+            await add_group_subscriber(self.room_group_name, self.channel_name)
+            self.subscription_task = asyncio.create_task(self.refresh_subscription())
 
             # we need the below code when we stat accepting tokens in websocket connection we just need to uncomment self.accept() and use whats given below
             # ref : https://github.com/django/channels/issues/1369#issuecomment-724299511
-            self.accept()
-            # self.accept(
+            await self.accept()
+            # await self.accept(
             #     "Token"
             # )
 
-    def disconnect(self, close_code):
-        # Leave room group
-        async_to_sync(self.channel_layer.group_discard)(
-            self.room_group_name, self.channel_name
-        )
+    async def disconnect(self, close_code):
+        if getattr(self, "flush_task", None):
+            self.flush_task.cancel()
+        if getattr(self, "subscription_task", None):
+            self.subscription_task.cancel()
+        if hasattr(self, "room_group_name"):
+            # Leave room group
+            await self.channel_layer.group_discard(
+                self.room_group_name, self.channel_name
+            )
+            await remove_group_subscriber(self.room_group_name, self.channel_name)
+
+    async def refresh_subscription(self):
+        while True:
+            await asyncio.sleep(settings.OBSERVATIONS_WS_SUBSCRIPTION_TTL / 2)
+            await add_group_subscriber(self.room_group_name, self.channel_name)
+
+    async def throttle(self, event: dict):
+        if self.interval:
+            if self.flush_task:
+                # merged into the pending flush
+                self.buffer_message(event)
+                return
+            delay = self.last_flush + self.interval - time.monotonic()
+            if delay > 0:
+                self.buffer_message(event)
+                self.flush_task = asyncio.create_task(self.flush_later(delay))
+                return
+            # nothing is buffered without a pending flush, so the message is
+            # sent as it was encoded by the sender
+            self.last_flush = time.monotonic()
+        await self.send_message(event)
+
+    async def flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        self.last_flush = time.monotonic()
+        await self.send_buffer()
+
+
+class observations(ThrottledConsumer):
+    def get_group_name(self, ip, query):
+        # clients reading waveforms from the binary route opt out of them here
+        if query.get("waveform", [""])[0].lower() == "false":
+            return f"vitals_ip_{ip}"
+        return f"ip_{ip}"
+
+    def create_buffer(self):
+        return ObservationBuffer(settings.OBSERVATIONS_WS_WAVEFORM_BUFFER)
+
+    def buffer_message(self, event):
+        self.buffer.add(event["observations"])
+
+    async def send_message(self, event):
+        # the frame is encoded once by the sender for every subscriber
+        await self.send(text_data=event["text"])
+
+    async def send_buffer(self):
+        if self.buffer:
+            await self.send(text_data=self.buffer.flush())
 
     # Receive message from room group
-    def send_observation(self, event):
-        message = event["message"]
+    async def send_observation(self, event):
+        await self.throttle(event)
+
+
+class waveforms(ThrottledConsumer):
+    """
+    Waveforms of a device as binary frames, see `encode_waveform_frame`
+    """
+
+    def get_group_name(self, ip, query):
+        return f"waveform_ip_{ip}"
+
+    def create_buffer(self):
+        # frames are self delimiting, buffered ones are sent concatenated
+        return deque(maxlen=settings.OBSERVATIONS_WS_WAVEFORM_BUFFER)
+
+    def buffer_message(self, event):
+        self.buffer.append(event["bytes"])
+
+    async def send_message(self, event):
+        await self.send(bytes_data=event["bytes"])
+
+    async def send_buffer(self):
+        if self.buffer:
+            frames = b"".join(self.buffer)
+            self.buffer.clear()
+            await self.send(bytes_data=frames)
+
+    async def send_waveform(self, event):
+        await self.throttle(event)
+
+
+class camera_movements(AsyncWebsocketConsumer):
+    """
+    Reports the end of the camera moves started without waiting for them
+    """
+
+    async def connect(self):
+        set_movement_loop(asyncio.get_running_loop())
+        self.room_group_name = get_movement_group_name(
+            self.scope["url_route"]["kwargs"]["ip_address"]
+        )
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
-        # Send message to WebSocket
-        self.send(text_data=json.dumps(message))
+    async def send_movement(self, event):
+        await self.send(text_data=json.dumps({"status": event["status"]}))
 
 
 class LoggerConsumer(AsyncConsumer):
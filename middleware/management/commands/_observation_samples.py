@@ -0,0 +1,68 @@
+import random
+from datetime import datetime
+from typing import List
+
+VITALS = [
+    ("heart-rate", "bpm", 60, 120),
+    ("SpO2", "%", 90, 100),
+    ("respiratory-rate", "/min", 12, 25),
+    ("body-temperature1", "degF", 96, 101),
+]
+WAVES = [("II", "250"), ("Pleth", "125"), ("Respiration", "62.5")]
+
+
+def sample_vital(device_id: str, observation_id: str, unit, low, high) -> dict:
+    return {
+        "observation_id": observation_id,
+        "device_id": device_id,
+        "date-time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "patient-id": "1",
+        "patient-name": "Sample Patient",
+        "status": "final",
+        "value": round(random.uniform(low, high), 1),
+        "unit": unit,
+        "interpretation": "normal",
+        "low-limit": low,
+        "high-limit": high,
+    }
+
+
+def sample_waveform(device_id: str, wave_name: str, sampling_rate: str) -> dict:
+    samples = int(float(sampling_rate))
+    return {
+        "observation_id": "waveform",
+        "device_id": device_id,
+        "date-time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "patient-id": "1",
+        "patient-name": "Sample Patient",
+        "status": "final",
+        "wave-name": wave_name,
+        "resolution": "1",
+        "sampling rate": sampling_rate,
+        "data-baseline": 2048,
+        "data-low-limit": 0,
+        "data-high-limit": 4095,
+        "data": " ".join(str(random.randint(1800, 2300)) for _ in range(samples)),
+    }
+
+
+def sample_vitals(device_id: str) -> List[dict]:
+    return [sample_vital(device_id, *vital) for vital in VITALS]
+
+
+def sample_waveforms(device_id: str) -> List[dict]:
+    return [sample_waveform(device_id, *wave) for wave in WAVES]
+
+
+def sample_batch(devices: int, waveforms: bool = True) -> List[dict]:
+    """
+    Build a gateway payload with one reading of every vital, and optionally
+    one second of every waveform, for each device.
+    """
+    batch = []
+    for index in range(devices):
+        device_id = f"192.168.{index // 250}.{index % 250 + 1}"
+        batch.extend(sample_vitals(device_id))
+        if waveforms:
+            batch.extend(sample_waveforms(device_id))
+    return batch
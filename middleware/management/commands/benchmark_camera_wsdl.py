@@ -0,0 +1,101 @@
+import os
+import time
+import tracemalloc
+
+import psutil
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from onvif.definition import SERVICES
+from zeep import Client
+from zeep.transports import Transport
+
+from middleware.camera.onvif_zeep_camera_controller import OnvifZeepCameraController
+from middleware.camera.types import CameraAsset
+from middleware.camera.wsdl import (
+    create_zeep_client,
+    get_wsdl_document,
+    get_zeep_settings,
+)
+
+# the services a controller connects to, the events service is tried on connect
+CONTROLLER_SERVICES = ("devicemgmt", "events", "media", "ptz")
+
+
+class Command(BaseCommand):
+    """
+    Benchmark building the SOAP clients of camera controllers
+    """
+
+    help = (
+        "Report the time and memory to build the service clients of camera "
+        "controllers, parsing the WSDLs per controller (cold) against the "
+        "parsed WSDLs of the process (warm). Pass --hostname to also time "
+        "connecting to a real camera."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--controllers", type=int, default=20, help="controllers kept alive"
+        )
+        parser.add_argument("--hostname")
+        parser.add_argument("--port", type=int, default=80)
+        parser.add_argument("--username", default="admin")
+        parser.add_argument("--password", default="")
+
+    def handle(self, *args, **options):
+        wsdl_files = [
+            os.path.join(settings.WSDL_PATH, SERVICES[name]["wsdl"])
+            for name in CONTROLLER_SERVICES
+        ]
+        process = psutil.Process()
+
+        for name, create_client in (
+            ("cold, parse per controller", self.create_parsed_client),
+            ("warm, shared wsdls", self.create_cached_client),
+        ):
+            get_wsdl_document.cache_clear()
+            rss = process.memory_info().rss
+            tracemalloc.start()
+            start = time.perf_counter()
+            # the clients are kept like the pool keeps its controllers
+            clients = [
+                [create_client(wsdl_file) for wsdl_file in wsdl_files]
+                for _ in range(options["controllers"])
+            ]
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f"{name}: {elapsed / len(clients) * 1000:.1f} ms per controller, "
+                f"peak {peak / 2**20:.1f} MiB, "
+                f"rss +{(process.memory_info().rss - rss) / 2**20:.1f} MiB "
+                f"for {len(clients)} controllers"
+            )
+            del clients
+
+        if options["hostname"]:
+            req = CameraAsset(
+                hostname=options["hostname"],
+                port=options["port"],
+                username=options["username"],
+                password=options["password"],
+            )
+            get_wsdl_document.cache_clear()
+            for name in ("cold", "warm"):
+                start = time.perf_counter()
+                OnvifZeepCameraController(req=req)
+                self.stdout.write(
+                    f"{name} controller for {req.hostname}: "
+                    f"{(time.perf_counter() - start) * 1000:.1f} ms"
+                )
+
+    def create_parsed_client(self, wsdl_file):
+        # what onvif does for every service of every camera
+        return Client(
+            wsdl=wsdl_file,
+            transport=Transport(timeout=settings.CAMERA_TIMEOUT),
+            settings=get_zeep_settings(),
+        )
+
+    def create_cached_client(self, wsdl_file):
+        return create_zeep_client(wsdl_file, "user", "password")
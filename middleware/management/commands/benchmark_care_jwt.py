@@ -0,0 +1,46 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from middleware.utils import _jwt_cache, generate_jwt, get_cached_jwt
+
+
+class Command(BaseCommand):
+    """
+    Microbenchmark signing the tokens of CARE requests
+    """
+
+    help = (
+        "Report the signing cost of the CARE requests of a daily rounds run, "
+        "signing every request against reusing cached tokens"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--assets", type=int, default=300)
+        parser.add_argument(
+            "--requests-per-asset",
+            type=int,
+            default=2,
+            help="patient lookup and daily round by default",
+        )
+
+    def handle(self, *args, **options):
+        claims = [{"asset_id": str(uuid.uuid4())} for _ in range(options["assets"])]
+        requests = [
+            claim for claim in claims for _ in range(options["requests_per_asset"])
+        ]
+
+        for name, sign in (
+            ("sign every request", generate_jwt),
+            ("cached", get_cached_jwt),
+        ):
+            _jwt_cache.clear()
+            start = time.perf_counter()
+            for claim in requests:
+                sign(claims=claim)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{name}: {elapsed * 1000:.1f} ms for {len(requests)} requests, "
+                f"{elapsed / len(requests) * 1000:.3f} ms per request"
+            )
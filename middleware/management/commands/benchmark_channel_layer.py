@@ -0,0 +1,114 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    """
+    Benchmark observation fan-out through a channel layer
+    """
+
+    help = (
+        "Fan out messages to device groups through a channel layer, eg. on a "
+        "local Redis, and report delivery throughput, latency and losses"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            choices=settings.CHANNEL_LAYER_BACKENDS.keys(),
+            default="redis_pubsub",
+        )
+        parser.add_argument(
+            "--hosts",
+            nargs="+",
+            default=settings.CHANNEL_LAYER_REDIS_HOSTS,
+            help="redis urls, groups are sharded across them",
+        )
+        parser.add_argument("--groups", type=int, default=60)
+        parser.add_argument("--subscribers", type=int, default=5)
+        parser.add_argument("--messages", type=int, default=20)
+        parser.add_argument("--payload-bytes", type=int, default=2000)
+        parser.add_argument("--timeout", type=float, default=30.0, help="in secs")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        backend = options["backend"]
+        config = {}
+        if backend == "redis":
+            config = {"hosts": options["hosts"], "capacity": options["messages"] + 1}
+        elif backend == "redis_pubsub":
+            config = {"hosts": options["hosts"]}
+        layer = import_string(settings.CHANNEL_LAYER_BACKENDS[backend])(**config)
+
+        groups = [f"ip_benchmark_{index}" for index in range(options["groups"])]
+        subscriptions = []
+        for group in groups:
+            for _ in range(options["subscribers"]):
+                channel = await layer.new_channel()
+                await layer.group_add(group, channel)
+                subscriptions.append((group, channel))
+
+        latencies = []
+
+        async def subscriber(channel):
+            for _ in range(options["messages"]):
+                message = await layer.receive(channel)
+                latencies.append(time.perf_counter() - message["sent"])
+
+        receivers = [
+            asyncio.create_task(subscriber(channel)) for _, channel in subscriptions
+        ]
+        # let the subscriptions settle before publishing
+        await asyncio.sleep(0.5)
+
+        payload = "x" * options["payload_bytes"]
+        start = time.perf_counter()
+        for _ in range(options["messages"]):
+            await asyncio.gather(
+                *(
+                    layer.group_send(
+                        group,
+                        {
+                            "type": "send_observation",
+                            "observations": [[None, payload]],
+                            "sent": time.perf_counter(),
+                        },
+                    )
+                    for group in groups
+                )
+            )
+        send_elapsed = time.perf_counter() - start
+
+        done, pending = await asyncio.wait(receivers, timeout=options["timeout"])
+        elapsed = time.perf_counter() - start
+        for task in pending:
+            task.cancel()
+
+        for group, channel in subscriptions:
+            await layer.group_discard(group, channel)
+        if hasattr(layer, "flush"):
+            await layer.flush()
+
+        if backend != "memory":
+            backend = f"{backend} on {len(options['hosts'])} host(s)"
+        sent = options["messages"] * len(groups)
+        expected = options["messages"] * len(subscriptions)
+        self.stdout.write(
+            f"{backend}: "
+            f"{sent / send_elapsed:,.0f} group sends/sec, "
+            f"{len(latencies) / elapsed:,.0f} deliveries/sec, "
+            f"{expected - len(latencies)} of {expected} deliveries lost"
+        )
+        if len(latencies) >= 2:
+            percentiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"latency p50 {percentiles[49] * 1000:.1f} ms, "
+                f"p99 {percentiles[98] * 1000:.1f} ms"
+            )
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from middleware.management.commands._observation_samples import sample_batch
+from middleware.observation.types import ObservationList
+from middleware.observation.views import build_observation_message
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the CPU cost of broadcasting a batch to a device group
+    """
+
+    help = (
+        "Report CPU time per broadcast of one device batch as the subscribers "
+        "of its group grow, encoding per subscriber against encoding once, "
+        "next to the cost of the in-memory channel layer delivering an empty "
+        "message"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--subscribers", type=int, nargs="+", default=[1, 10, 25, 50, 100]
+        )
+        parser.add_argument("--broadcasts", type=int, default=50)
+
+    def handle(self, *args, **options):
+        observations = ObservationList.model_validate(sample_batch(devices=1)).root
+        for subscribers in options["subscribers"]:
+            per_subscriber, once, layer = asyncio.run(
+                self.measure(observations, subscribers, options["broadcasts"])
+            )
+            self.stdout.write(
+                f"{subscribers} subscribers: "
+                f"encode per subscriber {per_subscriber * 1000:.2f} ms, "
+                f"encode once {once * 1000:.2f} ms, "
+                f"channel layer alone {layer * 1000:.2f} ms CPU per broadcast"
+            )
+
+    async def measure(self, observations, subscribers, broadcasts):
+        # the previous path, dicts on the channel layer dumped by every consumer
+        def per_subscriber_message():
+            return {
+                "type": "send_observation",
+                "message": [
+                    observation.model_dump(mode="json", by_alias=True)
+                    for observation in observations
+                ],
+            }
+
+        def per_subscriber_send(event):
+            return json.dumps(event["message"])
+
+        def once_message():
+            return build_observation_message(
+                [
+                    (None, observation.model_dump_json(by_alias=True))
+                    for observation in observations
+                ]
+            )
+
+        def once_send(event):
+            # what an observations consumer sends when nothing is buffered
+            return event["text"]
+
+        # the cost of the delivery itself, with an empty message
+        def empty_message():
+            return {"type": "send_observation"}
+
+        results = []
+        for build, send in (
+            (per_subscriber_message, per_subscriber_send),
+            (once_message, once_send),
+            (empty_message, lambda event: None),
+        ):
+            layer = InMemoryChannelLayer(capacity=broadcasts + 1)
+            channels = [await layer.new_channel() for _ in range(subscribers)]
+            for channel in channels:
+                await layer.group_add("ip_benchmark", channel)
+
+            start = time.process_time()
+            for _ in range(broadcasts):
+                await layer.group_send("ip_benchmark", build())
+                for channel in channels:
+                    send(await layer.receive(channel))
+            results.append((time.process_time() - start) / broadcasts)
+        return results
@@ -0,0 +1,85 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from middleware.management.commands._observation_samples import sample_batch
+
+
+class Command(BaseCommand):
+    """
+    Load test the sync and async observation ingest endpoints
+    """
+
+    help = (
+        "Post gateway batches to a running server (eg. daphne started with "
+        "scripts/start-backend.sh) and report POSTs/sec and latency percentiles "
+        "for the sync and async ingest endpoints"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://localhost:8090")
+        parser.add_argument("--duration", type=float, default=10.0, help="in secs")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--devices", type=int, default=4)
+        parser.add_argument(
+            "--no-waveforms", action="store_true", help="post vitals only"
+        )
+
+    def handle(self, *args, **options):
+        payload = sample_batch(
+            devices=options["devices"], waveforms=not options["no_waveforms"]
+        )
+        for name, path in (
+            ("sync", "update_observations"),
+            ("async", "update_observations/async"),
+        ):
+            latencies, errors, elapsed = self.run_load(
+                url=f"{options['base_url'].rstrip('/')}/{path}",
+                payload=payload,
+                duration=options["duration"],
+                concurrency=options["concurrency"],
+            )
+            self.report(name, latencies, errors, elapsed)
+
+    def run_load(self, url, payload, duration, concurrency):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            nonlocal errors
+            session = requests.Session()
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = session.post(url, json=payload, timeout=30)
+                    failed = response.status_code != 200
+                except requests.RequestException:
+                    failed = True
+                latency = time.perf_counter() - start
+                with lock:
+                    latencies.append(latency)
+                    errors += failed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+        return latencies, errors, time.perf_counter() - start
+
+    def report(self, name, latencies, errors, elapsed):
+        if len(latencies) < 2:
+            self.stdout.write(f"{name}: not enough requests completed")
+            return
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{name}: {len(latencies) / elapsed:.1f} POSTs/sec, "
+            f"p50 {percentiles[49] * 1000:.1f} ms, "
+            f"p99 {percentiles[98] * 1000:.1f} ms, "
+            f"{errors} errors out of {len(latencies)} requests"
+        )
@@ -0,0 +1,74 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from middleware.management.commands._observation_samples import (
+    sample_vitals,
+    sample_waveforms,
+)
+from middleware.observation.types import Observation, ObservationList
+from middleware.observation.utils import serialize_observation_member
+from middleware.observation.views import parse_observations_json
+
+
+class Command(BaseCommand):
+    """
+    Microbenchmark observation parsing
+    """
+
+    help = (
+        "Report items/sec for parsing vitals and waveform gateway payloads, "
+        "and for reading stored observations back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.repeat = options["repeat"]
+        for name, sample in (("vitals", sample_vitals), ("waveform", sample_waveforms)):
+            items = []
+            while len(items) < options["items"]:
+                items.extend(sample("192.168.1.1"))
+            body = json.dumps(items).encode()
+            members = [
+                serialize_observation_member(observation).encode()
+                for observation in ObservationList.model_validate(items).root
+            ]
+
+            self.report(
+                name,
+                "ingest json.loads + model_validate",
+                len(items),
+                lambda: ObservationList.model_validate(json.loads(body)),
+            )
+            self.report(
+                name,
+                "ingest parse_observations_json",
+                len(items),
+                lambda: parse_observations_json(body),
+            )
+            self.report(
+                name,
+                "ingest model_construct",
+                len(items),
+                lambda: [Observation.model_construct(**item) for item in items],
+            )
+            self.report(
+                name,
+                "read json.loads + model_validate",
+                len(members),
+                lambda: [Observation.model_validate(json.loads(m)) for m in members],
+            )
+            self.report(
+                name,
+                "read model_validate_json",
+                len(members),
+                lambda: [Observation.model_validate_json(m) for m in members],
+            )
+
+    def report(self, name, method, count, func):
+        elapsed = min(timeit.repeat(func, number=1, repeat=self.repeat))
+        self.stdout.write(f"{name} {method}: {count / elapsed:,.0f} items/sec")
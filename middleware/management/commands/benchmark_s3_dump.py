@@ -0,0 +1,171 @@
+import json
+import time
+import tracemalloc
+from datetime import timedelta
+
+import boto3
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils.timezone import now
+from django_redis import get_redis_connection
+
+from middleware.management.commands._observation_samples import sample_batch
+from middleware.observation.types import ObservationList
+from middleware.observation.utils import (
+    dump_device_observations_to_s3,
+    get_observation_devices_key,
+    get_observations_from_redis,
+    get_observations_key,
+    get_s3_client,
+    get_s3_transfer_manager,
+    store_observations,
+)
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the observations S3 dump against a local S3 stand-in
+    """
+
+    help = (
+        "Seed Redis with a window of observations and report time, peak memory "
+        "and bytes uploaded for the single JSON object dump against the "
+        "streaming archive. Point --endpoint-url at MinIO or `moto_server`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint-url", default=settings.S3_ENDPOINT_URL)
+        parser.add_argument("--bucket", default="benchmark-observations")
+        parser.add_argument("--devices", type=int, default=5)
+        parser.add_argument(
+            "--minutes", type=int, default=10, help="window seeded, one batch/sec"
+        )
+        parser.add_argument("--no-waveforms", action="store_true")
+
+    def handle(self, *args, **options):
+        if not options["endpoint_url"]:
+            raise CommandError(
+                "Pass --endpoint-url of a local S3 stand-in, this uploads data"
+            )
+        s3_settings = {
+            "S3_ACCESS_KEY_ID": settings.S3_ACCESS_KEY_ID or "benchmark",
+            "S3_SECRET_ACCESS_KEY": settings.S3_SECRET_ACCESS_KEY or "benchmark",
+            "S3_ENDPOINT_URL": options["endpoint_url"],
+            "S3_BUCKET_NAME": options["bucket"],
+        }
+        s3 = self.create_client(s3_settings)
+        try:
+            s3.create_bucket(Bucket=options["bucket"])
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "BucketAlreadyOwnedByYou":
+                raise
+
+        device_ids = [f"benchmark-{index}" for index in range(options["devices"])]
+        until = self.seed(device_ids, options["minutes"], not options["no_waveforms"])
+        try:
+            with override_settings(**s3_settings):
+                get_s3_client.cache_clear()
+                get_s3_transfer_manager.cache_clear()
+                for name, dump in (
+                    ("single json object", self.dump_json),
+                    ("streaming ndjson.gz", self.dump_streaming),
+                ):
+                    prefix = f"benchmark/{name.split()[0]}"
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    count = dump(s3_settings, prefix, device_ids, until)
+                    elapsed = time.perf_counter() - start
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    size = self.uploaded_bytes(s3, options["bucket"], prefix)
+                    self.stdout.write(
+                        f"{name}: {count} observations in {elapsed:.2f}s, "
+                        f"peak {peak / 2**20:.1f} MiB, "
+                        f"{size / 2**20:.1f} MiB uploaded"
+                    )
+
+                # the previous dump built a client on every run
+                runs = 10
+                start = time.perf_counter()
+                for _ in range(runs):
+                    self.create_client(s3_settings)
+                per_run = (time.perf_counter() - start) / runs
+                start = time.perf_counter()
+                for _ in range(runs):
+                    get_s3_transfer_manager()
+                pooled = (time.perf_counter() - start) / runs
+                self.stdout.write(
+                    f"client per run: {per_run * 1000:.1f} ms, "
+                    f"pooled client: {pooled * 1000:.3f} ms"
+                )
+        finally:
+            get_s3_client.cache_clear()
+            get_s3_transfer_manager.cache_clear()
+            redis = get_redis_connection("default")
+            redis.delete(*(get_observations_key(device_id) for device_id in device_ids))
+            redis.zrem(get_observation_devices_key(), *device_ids)
+
+    def seed(self, device_ids, minutes, waveforms):
+        start = now() - timedelta(minutes=minutes)
+        for second in range(minutes * 60):
+            observations = ObservationList.model_validate(
+                sample_batch(devices=len(device_ids), waveforms=waveforms)
+            ).root
+            taken_at = start + timedelta(seconds=second)
+            # keep the seeded data apart from any real device
+            addresses = dict(
+                zip(dict.fromkeys(o.device_id for o in observations), device_ids)
+            )
+            for observation in observations:
+                observation.device_id = addresses[observation.device_id]
+                observation.taken_at = taken_at
+            store_observations(observations)
+        return now()
+
+    def create_client(self, s3_settings):
+        return boto3.client(
+            "s3",
+            aws_access_key_id=s3_settings["S3_ACCESS_KEY_ID"],
+            aws_secret_access_key=s3_settings["S3_SECRET_ACCESS_KEY"],
+            endpoint_url=s3_settings["S3_ENDPOINT_URL"],
+        )
+
+    def dump_json(self, s3_settings, prefix, device_ids, until):
+        # the previous dump, a new client and every observation in one list
+        s3 = self.create_client(s3_settings)
+        data = []
+        for device_id in device_ids:
+            data.extend(
+                observation.model_dump(mode="json", by_alias=True)
+                for observation in get_observations_from_redis(
+                    device_id=device_id, until=until
+                )
+            )
+        s3.put_object(
+            Bucket=settings.S3_BUCKET_NAME,
+            Key=f"{prefix}/dump.json",
+            Body=json.dumps(data).encode(),
+            ContentType="application/json",
+        )
+        return len(data)
+
+    def dump_streaming(self, s3_settings, prefix, device_ids, until):
+        return sum(
+            dump_device_observations_to_s3(
+                get_s3_transfer_manager(),
+                prefix=prefix,
+                device_id=device_id,
+                until=until,
+            )
+            for device_id in device_ids
+        )
+
+    def uploaded_bytes(self, s3, bucket, prefix):
+        size = 0
+        for page in s3.get_paginator("list_objects_v2").paginate(
+            Bucket=bucket, Prefix=prefix
+        ):
+            size += sum(item["Size"] for item in page.get("Contents", []))
+        return size
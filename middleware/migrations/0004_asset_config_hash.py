@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("middleware", "0003_alter_asset_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="asset",
+            name="config_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
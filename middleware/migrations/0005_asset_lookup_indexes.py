@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("middleware", "0004_asset_config_hash"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="asset",
+            index=models.Index(
+                fields=["ip_address", "deleted"], name="middleware__ip_addr_f9caa4_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="asset",
+            index=models.Index(
+                fields=["type", "deleted"], name="middleware__type_9f6f14_idx"
+            ),
+        ),
+    ]
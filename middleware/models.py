@@ -33,10 +33,14 @@ class Asset(models.Model):
     username = models.CharField(max_length=255, null=True, blank=True)
     password = models.CharField(max_length=255, null=True, blank=True)
     port = models.IntegerField(default=80, null=True, blank=True)
+    # digest of the asset config last synced from CARE
+    config_hash = models.CharField(max_length=64, blank=True, default="")
 
     class Meta:
         indexes = [
             models.Index(fields=["id", "ip_address"]),
+            models.Index(fields=["ip_address", "deleted"]),
+            models.Index(fields=["type", "deleted"]),
         ]
 
 
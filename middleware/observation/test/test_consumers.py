@@ -0,0 +1,128 @@
+import json
+from unittest import TestCase as UnitTest
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import override_settings
+from django_redis import get_redis_connection
+
+from middleware.consumers import (
+    ObservationBuffer,
+    ThrottledConsumer,
+    get_update_interval,
+)
+from middleware.observation.utils import (
+    ObservationFragments,
+    encode_json_array,
+    get_group_subscribers_key,
+)
+from middleware.redis_manager import redis_manager
+from middleware.urls import websocket_urlpatterns
+
+
+def vital(observation_id, value):
+    return (
+        observation_id,
+        json.dumps({"observation_id": observation_id, "value": value}),
+    )
+
+
+def waveform(value):
+    return (None, json.dumps({"observation_id": "waveform", "data": value}))
+
+
+def observation_message(*fragments):
+    return {
+        "type": "send_observation",
+        "text": encode_json_array([fragment for _, fragment in fragments]),
+        "observations": ObservationFragments(fragments),
+    }
+
+
+class TestObservationConsumer(UnitTest):
+    def test_get_update_interval(self):
+        self.assertEqual(0.1, get_update_interval({}))
+        self.assertEqual(0.5, get_update_interval({"max_rate": ["2"]}))
+        # clients cannot ask for more than the server limit
+        self.assertEqual(0.1, get_update_interval({"max_rate": ["50"]}))
+        self.assertEqual(0.1, get_update_interval({"max_rate": ["fast"]}))
+        with override_settings(OBSERVATIONS_WS_MAX_RATE=0):
+            self.assertEqual(0, get_update_interval({}))
+
+    def test_throttled_consumer_hooks_are_abstract(self):
+        with self.assertRaises(TypeError):
+            ThrottledConsumer()
+
+    def test_observation_buffer(self):
+        buffer = ObservationBuffer(waveform_limit=2)
+
+        buffer.add([vital("heart-rate", 60), waveform("1"), waveform("2")])
+        buffer.add([vital("heart-rate", 61), vital("SpO2", 98), waveform("3")])
+
+        observations = json.loads(buffer.flush())
+        self.assertEqual(
+            [61, 98, "2", "3"],
+            [o.get("value", o.get("data")) for o in observations],
+        )
+        self.assertFalse(buffer)
+
+    def test_throttled_client_gets_coalesced_frames(self):
+        async def run():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), "observations/1?max_rate=5"
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            channel_layer = get_channel_layer()
+            for value in range(3):
+                await channel_layer.group_send(
+                    "ip_1", observation_message(vital("heart-rate", value))
+                )
+
+            first = json.loads(await communicator.receive_from())
+            second = json.loads(await communicator.receive_from(timeout=1))
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+            return first, second
+
+        first, second = async_to_sync(run)()
+
+        self.assertEqual([0], [o["value"] for o in first])
+        self.assertEqual([2], [o["value"] for o in second])
+
+    def test_unthrottled_client_gets_the_encoded_frame(self):
+        message = observation_message(vital("heart-rate", 60), waveform("1"))
+
+        async def run():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), "observations/1"
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await get_channel_layer().group_send("ip_1", message)
+
+            text = await communicator.receive_from()
+            await communicator.disconnect()
+            return text
+
+        self.assertEqual(message["text"], async_to_sync(run)())
+
+    def test_subscriptions_are_kept_in_redis(self):
+        key = get_group_subscribers_key("waveform_ip_1")
+
+        async def run():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), "observations/1/waveform"
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            subscribers = await redis_manager.get_async_client().zcard(key)
+            await communicator.disconnect()
+            return subscribers
+
+        self.assertEqual(1, async_to_sync(run)())
+        self.assertEqual(0, get_redis_connection("default").zcard(key))
@@ -1,28 +1,85 @@
+import json
+from datetime import datetime, timedelta, timezone
 from unittest import TestCase as UnitTest
-from unittest.mock import MagicMock, call, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncClient, Client
+from pydantic import ValidationError
 
 from middleware.observation.test.util_factory import ObservationFactory
-from middleware.observation.types import ObservationID
+from middleware.observation.types import WAVEFORM_OBSERVATION_IDS, ObservationID
+from middleware.observation.utils import (
+    add_group_subscriber,
+    encode_json_array,
+    encode_waveform_frame,
+    get_static_observations,
+    store_observations,
+)
 from middleware.observation.views import (
-    blood_pressure_data,
     flatten_observations,
+    get_blood_pressure_data,
+    parse_observations_json,
+    queue_blood_pressure_reads,
     store_and_send_observations,
-    update_blood_pressure,
 )
+from middleware.redis_manager import redis_manager
+from middleware.utils import group_send_all
+
+
+def as_fragments(*observations):
+    return tuple(
+        (
+            None
+            if o.observation_id in WAVEFORM_OBSERVATION_IDS
+            else o.observation_id.value,
+            o.model_dump_json(by_alias=True),
+        )
+        for o in observations
+    )
+
+
+def as_message(*observations):
+    return {
+        "type": "send_observation",
+        "text": encode_json_array(
+            [o.model_dump_json(by_alias=True) for o in observations]
+        ),
+        "observations": as_fragments(*observations),
+    }
 
 
 class TestObservation(UnitTest):
-    def test_update_blood_pressure(self):
+    def setUp(self):
+        cache.clear()
+
+    def test_queue_blood_pressure_reads(self):
         observation_1 = ObservationFactory(observation_id=ObservationID.BLOOD_PRESSURE)
         observation_2 = ObservationFactory(
             observation_id=ObservationID.BODY_TEMPERATURE1
         )
+        observation_3 = ObservationFactory(
+            observation_id=ObservationID.BODY_TEMPERATURE1
+        )
+        store_observations([observation_1, observation_2])
 
-        list_of_observation = [observation_1, observation_2]
-        update_blood_pressure(list_of_observation)
-        self.assertEqual(blood_pressure_data[observation_1.device_id], observation_1)
-        with self.assertRaises(KeyError):
-            blood_pressure_data[observation_2.device_id]
+        pipeline = redis_manager.get_pipeline()
+        device_ids = queue_blood_pressure_reads(
+            pipeline,
+            {
+                observation_1.device_id: [observation_2],
+                observation_2.device_id: [observation_2],
+                observation_3.device_id: [observation_3],
+            },
+        )
+        blood_pressure_data = get_blood_pressure_data(device_ids, pipeline.execute())
+
+        self.assertEqual({observation_1.device_id}, set(blood_pressure_data))
+        self.assertEqual(
+            observation_1.systolic,
+            blood_pressure_data[observation_1.device_id].systolic,
+        )
 
     def test_flatten_observations(self):
         observation_1 = ObservationFactory()
@@ -40,6 +97,25 @@ class TestObservation(UnitTest):
         flattened_list = flatten_observations(nested_list)
         self.assertEqual(5, len(flattened_list))
 
+    def test_parse_observations_json(self):
+        observations = [
+            ObservationFactory().model_dump(mode="json", by_alias=True)
+            for _ in range(3)
+        ]
+
+        flat = parse_observations_json(json.dumps(observations))
+        nested = parse_observations_json(
+            json.dumps([observations[0], [observations[1], [observations[2]]]])
+        )
+
+        self.assertEqual(3, len(flat))
+        self.assertEqual(
+            [observation.model_dump() for observation in flat],
+            [observation.model_dump() for observation in nested],
+        )
+        with self.assertRaises(ValidationError):
+            parse_observations_json(json.dumps([{"device_id": "1"}]))
+
     @patch("middleware.observation.views.get_channel_layer")
     @patch("middleware.observation.views.async_to_sync")
     def test_store_and_send_observations(
@@ -61,33 +137,16 @@ class TestObservation(UnitTest):
         ]
 
         store_and_send_observations(data=observation_list)
-        self.assertEqual(2, mock_async_to_sync.call_count)
-
-        expected_calls = [
-            call(mock_channel_layer.group_send),
-            call()(
-                "ip_1",
-                {
-                    "type": "send_observation",
-                    "message": [
-                        device_1_observation_1.model_dump(mode="json", by_alias=True),
-                        device_1_observation_2.model_dump(mode="json", by_alias=True),
-                    ],
-                },
-            ),
-            call(mock_channel_layer.group_send),
-            call()(
-                "ip_2",
-                {
-                    "type": "send_observation",
-                    "message": [
-                        device_2_observation_1.model_dump(mode="json", by_alias=True),
-                        device_2_observation_2.model_dump(mode="json", by_alias=True),
-                    ],
-                },
-            ),
-        ]
-        mock_async_to_sync.assert_has_calls(expected_calls, any_order=True)
+
+        # the fan-out to every device goes through a single sync to async hop
+        mock_async_to_sync.assert_called_once_with(group_send_all)
+        mock_async_to_sync.return_value.assert_called_once_with(
+            mock_channel_layer,
+            {
+                "ip_1": as_message(device_1_observation_1, device_1_observation_2),
+                "ip_2": as_message(device_2_observation_1, device_2_observation_2),
+            },
+        )
 
     @patch("middleware.observation.views.get_channel_layer")
     @patch("middleware.observation.views.async_to_sync")
@@ -101,7 +160,7 @@ class TestObservation(UnitTest):
         device_1_observation_2 = ObservationFactory(
             device_id="1", observation_id=ObservationID.BODY_TEMPERATURE1
         )
-        update_blood_pressure([device_1_observation_1])
+        store_observations([device_1_observation_1])
 
         mock_channel_layer = MagicMock()
         mock_get_channel_layer.return_value = mock_channel_layer
@@ -109,19 +168,169 @@ class TestObservation(UnitTest):
             data=[device_1_observation_2.model_dump(mode="json", by_alias=True)]
         )
 
-        self.assertEqual(1, mock_async_to_sync.call_count)
+        mock_async_to_sync.assert_called_once_with(group_send_all)
+        mock_async_to_sync.return_value.assert_called_once_with(
+            mock_channel_layer,
+            {"ip_1": as_message(device_1_observation_2, device_1_observation_1)},
+        )
 
-        expected_call = [
-            call(mock_channel_layer.group_send),
-            call()(
-                "ip_1",
-                {
-                    "type": "send_observation",
-                    "message": [
-                        device_1_observation_2.model_dump(mode="json", by_alias=True),
-                        device_1_observation_1.model_dump(mode="json", by_alias=True),
-                    ],
-                },
-            ),
+    @patch("middleware.observation.views.get_channel_layer")
+    @patch("middleware.observation.views.async_to_sync")
+    def test_store_and_send_waveform_frames(
+        self, mock_async_to_sync, mock_get_channel_layer
+    ):
+        vital = ObservationFactory(
+            device_id="1", observation_id=ObservationID.HEART_RATE
+        )
+        waveform = ObservationFactory(
+            device_id="1", date_time=datetime(2024, 6, 10, 10, 0, 0), data="1 2 3"
+        )
+
+        data = [
+            vital.model_dump(mode="json", by_alias=True),
+            waveform.model_dump(mode="json", by_alias=True),
         ]
-        mock_async_to_sync.assert_has_calls(expected_call)
+
+        # nobody subscribed to the vitals and waveform routes
+        store_and_send_observations(data=data)
+        group_messages = mock_async_to_sync.return_value.call_args.args[1]
+        self.assertEqual({"ip_1"}, set(group_messages))
+
+        for group in ("vitals_ip_1", "waveform_ip_1"):
+            async_to_sync(add_group_subscriber)(group, f"{group}.channel")
+        store_and_send_observations(data=data)
+
+        group_messages = mock_async_to_sync.return_value.call_args.args[1]
+        self.assertEqual({"ip_1", "vitals_ip_1", "waveform_ip_1"}, set(group_messages))
+        self.assertEqual(
+            as_fragments(vital, waveform), group_messages["ip_1"]["observations"]
+        )
+        self.assertEqual(
+            as_fragments(vital), group_messages["vitals_ip_1"]["observations"]
+        )
+        self.assertEqual(
+            encode_waveform_frame(waveform), group_messages["waveform_ip_1"]["bytes"]
+        )
+
+    @patch("middleware.observation.views.get_channel_layer")
+    @patch("middleware.observation.views.async_to_sync")
+    def test_store_and_send_observations_single_round_trip(
+        self, mock_async_to_sync, mock_get_channel_layer
+    ):
+        observation_list = [
+            ObservationFactory(device_id=str(device_id)).model_dump(
+                mode="json", by_alias=True
+            )
+            for device_id in range(10)
+        ]
+
+        with patch(
+            "middleware.observation.views.redis_manager.get_pipeline"
+        ) as mock_get_pipeline:
+            store_and_send_observations(data=observation_list)
+
+        mock_get_pipeline.assert_called_once()
+        mock_get_pipeline.return_value.execute.assert_called_once()
+
+    @patch("middleware.observation.views.get_channel_layer")
+    def test_update_observations_async(self, mock_get_channel_layer):
+        mock_channel_layer = MagicMock()
+        mock_channel_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_channel_layer
+        observation = ObservationFactory(device_id="1")
+
+        response = async_to_sync(AsyncClient().post)(
+            "/update_observations/async",
+            data=[observation.model_dump(mode="json", by_alias=True)],
+            content_type="application/json",
+        )
+
+        self.assertEqual(200, response.status_code)
+        mock_channel_layer.group_send.assert_awaited_once_with(
+            "ip_1",
+            as_message(observation),
+        )
+        static_observation = get_static_observations(device_id="1")
+        self.assertEqual(
+            observation.patient_id,
+            static_observation.observations[observation.observation_id][0].patient_id,
+        )
+
+    def test_update_observations_invalid_payload(self):
+        response = Client().post(
+            "/update_observations",
+            data="not json",
+            content_type="application/json",
+        )
+        self.assertEqual(400, response.status_code)
+
+        response = Client().post(
+            "/update_observations",
+            data=[{"device_id": "1"}],
+            content_type="application/json",
+        )
+        self.assertEqual(400, response.status_code)
+
+    def test_update_observations_async_invalid_payload(self):
+        response = async_to_sync(AsyncClient().post)(
+            "/update_observations/async",
+            data=[{"device_id": "1"}],
+            content_type="application/json",
+        )
+
+        self.assertEqual(400, response.status_code)
+
+
+class TestStatusTimeSeries(UnitTest):
+    series = "test_statuses"
+
+    def setUp(self):
+        redis_manager.get_pipeline().delete(
+            redis_manager.get_time_series_index_key(self.series)
+        ).execute()
+
+    def test_time_series_range(self):
+        start = datetime(2024, 1, 1, 10, 0, 30, tzinfo=timezone.utc)
+        for minute in range(5):
+            redis_manager.add_to_time_series(
+                self.series,
+                {"192.168.1.1": "up" if minute % 2 else "down"},
+                time=start + timedelta(minutes=minute),
+            )
+        # a later status of a minute replaces the earlier one
+        redis_manager.add_to_time_series(
+            self.series, {"192.168.1.1": "up"}, time=start + timedelta(minutes=4)
+        )
+
+        statuses = redis_manager.get_time_series(self.series)
+        self.assertEqual(
+            ["2024-01-01T10:00:00.000Z", "2024-01-01T10:04:00.000Z"],
+            [statuses[0]["time"], statuses[-1]["time"]],
+        )
+        self.assertEqual(
+            ["down", "up", "down", "up", "up"],
+            [item["status"]["192.168.1.1"] for item in statuses],
+        )
+        self.assertEqual(
+            statuses[1:3],
+            redis_manager.get_time_series(
+                self.series,
+                since=datetime(2024, 1, 1, 10, 1),
+                until=datetime(2024, 1, 1, 10, 2),
+            ),
+        )
+        self.assertEqual(
+            statuses[-2:], redis_manager.get_time_series(self.series, limit=2)
+        )
+
+    def test_expired_statuses_are_trimmed(self):
+        start = datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+        redis_manager.add_to_time_series(self.series, {}, expiry=60, time=start)
+        redis_manager.add_to_time_series(
+            self.series, {}, expiry=60, time=start + timedelta(minutes=2)
+        )
+
+        self.assertEqual(
+            ["2024-01-01T10:02:00.000Z"],
+            [item["time"] for item in redis_manager.get_time_series(self.series)],
+        )
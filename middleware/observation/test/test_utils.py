@@ -1,43 +1,253 @@
+import gzip
+import json
+from array import array
+from datetime import datetime, timedelta
 from unittest import TestCase as UnitTest
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils.timezone import now
 from sentry_sdk.crons.consts import MonitorStatus
 
 from middleware.observation.test.util_factory import ObservationFactory
-from middleware.observation.types import DataDumpRequest, MonitorOptions
-from middleware.observation.utils import make_data_dump_to_s3
+from middleware.observation.types import (
+    DataDumpRequest,
+    MonitorOptions,
+    ObservationID,
+    WaveName,
+)
+from middleware.observation.utils import (
+    WAVE_NAME_CODES,
+    WAVEFORM_FRAME_HEADER,
+    WAVEFORM_FRAME_VERSION,
+    dump_device_observations_to_s3,
+    encode_waveform_frame,
+    get_closed_hours_end,
+    get_latest_observations,
+    get_observations_from_redis,
+    get_s3_client,
+    get_s3_dump_key,
+    get_s3_transfer_manager,
+    get_static_observations,
+    get_vitals_for_devices,
+    get_vitals_from_observations,
+    iter_observations_from_redis,
+    make_data_dump_to_s3,
+    store_observations,
+)
+
+
+def record_upload(uploads):
+    def upload(file, bucket, key, **kwargs):
+        uploads[key] = gzip.decompress(file.read()).decode().splitlines()
+        return MagicMock()
+
+    return upload
 
 
 class TestUtils(UnitTest):
+    def setUp(self):
+        cache.clear()
+        get_s3_client.cache_clear()
+        get_s3_transfer_manager.cache_clear()
+
+    def test_get_static_observations(self):
+        recent_observation = ObservationFactory(device_id="1", taken_at=now())
+        stale_observation = ObservationFactory(
+            device_id="1", taken_at=now() - timedelta(minutes=90)
+        )
+        other_device_observation = ObservationFactory(device_id="2", taken_at=now())
+        store_observations(
+            [stale_observation, recent_observation, other_device_observation]
+        )
+
+        static_observation = get_static_observations(device_id="1")
+
+        observations = static_observation.observations[
+            recent_observation.observation_id
+        ]
+        self.assertEqual(1, len(observations))
+        self.assertEqual(recent_observation.patient_id, observations[0].patient_id)
+        self.assertIsNone(get_static_observations(device_id="3"))
+
+    def test_get_latest_observations(self):
+        earlier_heart_rate = ObservationFactory(
+            device_id="1",
+            observation_id=ObservationID.HEART_RATE,
+            value=70,
+            taken_at=now() - timedelta(seconds=5),
+        )
+        heart_rate = ObservationFactory(
+            device_id="1", observation_id=ObservationID.HEART_RATE, value=72
+        )
+        spo2 = ObservationFactory(
+            device_id="1", observation_id=ObservationID.SPO2, value=97
+        )
+        store_observations(
+            [heart_rate, earlier_heart_rate, ObservationFactory(device_id="1")]
+        )
+        store_observations([spo2])
+
+        latest = get_latest_observations(device_id="1")
+
+        self.assertEqual(
+            {ObservationID.HEART_RATE, ObservationID.SPO2}, set(latest.observations)
+        )
+        self.assertEqual(72, latest.observations[ObservationID.HEART_RATE].value)
+        vitals = get_vitals_from_observations(ip_address="1")
+        self.assertEqual((72, 97), (vitals.pulse, vitals.spo2))
+        self.assertIsNone(get_latest_observations(device_id="2"))
+        self.assertEqual(
+            {"1": vitals, "2": None}, get_vitals_for_devices(device_ids=["1", "2"])
+        )
+
+        store_observations(
+            [ObservationFactory(device_id="2", taken_at=now() - timedelta(minutes=90))]
+        )
+        self.assertIsNone(get_latest_observations(device_id="2"))
+
+    def test_encode_waveform_frame(self):
+        observation = ObservationFactory(
+            observation_id=ObservationID.WAVEFORM_II,
+            wave_name=None,
+            sampling_rate="250",
+            data_baseline=2048,
+            data="2048 2050 -12 40000 2049.6",
+        )
+
+        frame = encode_waveform_frame(observation)
+
+        header = WAVEFORM_FRAME_HEADER.unpack_from(frame)
+        self.assertEqual(WAVEFORM_FRAME_VERSION, header[0])
+        self.assertEqual(WAVE_NAME_CODES[WaveName.II], header[1])
+        self.assertEqual((250, 2048), header[2:4])
+        self.assertEqual(5, header[-1])
+        samples = array("h", frame[WAVEFORM_FRAME_HEADER.size :])
+        self.assertEqual([2048, 2050, -12, 32767, 2050], samples.tolist())
+        self.assertIsNone(encode_waveform_frame(ObservationFactory(data="not a wave")))
+
+    def test_iter_observations_from_redis(self):
+        taken_at = now() - timedelta(minutes=90)
+        observations = [
+            ObservationFactory(device_id="1", taken_at=taken_at) for _ in range(3)
+        ] + [ObservationFactory(device_id="1", taken_at=now())]
+        store_observations(observations)
+
+        entries = list(
+            iter_observations_from_redis(device_id="1", until=now(), batch_size=1)
+        )
+
+        self.assertEqual(4, len(entries))
+        self.assertEqual(4, len({member for member, _ in entries}))
+
+    def test_identical_readings_are_kept(self):
+        reading = ObservationFactory(
+            device_id="1", taken_at=now() - timedelta(seconds=10)
+        )
+        observations = [
+            reading.model_copy(
+                update={"taken_at": reading.taken_at + timedelta(seconds=seconds)}
+            )
+            for seconds in range(3)
+        ]
+        store_observations(observations[:2])
+        store_observations(observations[2:])
+
+        stored = get_observations_from_redis(device_id="1")
+
+        self.assertEqual(
+            [observation.taken_at for observation in observations],
+            [observation.taken_at for observation in stored],
+        )
+        self.assertEqual({reading.value}, {observation.value for observation in stored})
+
+    def test_dump_device_observations_to_s3(self):
+        hour = (now() - timedelta(minutes=30)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        observations = [
+            ObservationFactory(device_id="1", taken_at=hour + timedelta(minutes=1)),
+            ObservationFactory(device_id="1", taken_at=hour + timedelta(minutes=2)),
+            ObservationFactory(device_id="1", taken_at=hour + timedelta(minutes=61)),
+        ]
+        store_observations(observations)
+        uploads = {}
+        mock_transfer_manager = MagicMock()
+        mock_transfer_manager.upload.side_effect = record_upload(uploads)
+
+        count = dump_device_observations_to_s3(
+            mock_transfer_manager,
+            prefix="host",
+            device_id="1",
+            until=hour + timedelta(minutes=90),
+        )
+
+        self.assertEqual(3, count)
+        self.assertEqual(
+            [
+                get_s3_dump_key("host", "1", observations[0].taken_at.timestamp()),
+                get_s3_dump_key("host", "1", observations[2].taken_at.timestamp()),
+            ],
+            list(uploads),
+        )
+        self.assertIn(f"/date={hour:%Y-%m-%d}/hour={hour:%H}/", list(uploads)[0])
+        self.assertEqual(
+            [
+                [observation.patient_id for observation in observations[:2]],
+                [observations[2].patient_id],
+            ],
+            [
+                [json.loads(line)["patient-id"] for line in lines]
+                for lines in uploads.values()
+            ],
+        )
+        self.assertEqual(
+            observations[0].taken_at,
+            datetime.fromisoformat(
+                json.loads(list(uploads.values())[0][0])["taken_at"]
+            ),
+        )
+
+    @patch("middleware.observation.utils.create_transfer_manager")
     @patch("middleware.observation.utils.boto3.client")
     @patch("middleware.observation.utils.capture_checkin")
-    @patch("middleware.observation.utils.settings")
+    @override_settings(
+        S3_BUCKET_NAME="test-bucket",
+        S3_ACCESS_KEY_ID="test-key",
+        S3_SECRET_ACCESS_KEY="test-secret",
+        S3_ENDPOINT_URL=None,
+    )
     def test_make_data_dump_to_s3(
-        self, mock_settings, mock_capture_checkin, mock_boto3_client
+        self, mock_capture_checkin, mock_boto3_client, mock_create_transfer_manager
     ):
-        mock_settings.S3_BUCKET_NAME = "test-bucket"
-        mock_settings.S3_ACCESS_KEY_ID = "test-key"
-        mock_settings.S3_SECRET_ACCESS_KEY = "test-secret"
-        mock_settings.S3_ENDPOINT_URL = None
-        mock_s3 = MagicMock()
-        mock_boto3_client.return_value = mock_s3
+        mock_transfer_manager = mock_create_transfer_manager.return_value
 
         mock_capture_checkin.return_value = "test-check-in-id"
-        observation_1 = ObservationFactory()
-        observation_2 = ObservationFactory()
+        taken_at = now() - timedelta(hours=1)
+        store_observations(
+            [
+                ObservationFactory(taken_at=taken_at),
+                ObservationFactory(taken_at=taken_at),
+            ]
+        )
         request = DataDumpRequest(
-            data=[observation_1, observation_2],
             key="test-key",
+            until=now(),
             monitor_options=MonitorOptions(slug="test-slug", options={}),
         )
 
         # Execute
         make_data_dump_to_s3(request)
+        make_data_dump_to_s3(request)
 
         # Assert
         mock_boto3_client.assert_called_once()
-        mock_s3.put_object.assert_called_once()
-        self.assertEqual(mock_capture_checkin.call_count, 2)
+        mock_create_transfer_manager.assert_called_once_with(
+            mock_boto3_client.return_value, ANY
+        )
+        self.assertEqual(2, mock_transfer_manager.upload.call_count)
+        self.assertEqual(mock_capture_checkin.call_count, 4)
         mock_capture_checkin.assert_any_call(
             monitor_slug="test-slug",
             status=MonitorStatus.IN_PROGRESS,
@@ -48,3 +258,62 @@ class TestUtils(UnitTest):
             monitor_slug="test-slug",
             status=MonitorStatus.OK,
         )
+
+    @patch("middleware.observation.utils.create_transfer_manager")
+    @patch("middleware.observation.utils.boto3.client")
+    @patch("middleware.observation.utils.capture_checkin")
+    @override_settings(S3_BUCKET_NAME="test-bucket")
+    def test_make_data_dump_to_s3_uploads_once(
+        self, mock_capture_checkin, mock_boto3_client, mock_create_transfer_manager
+    ):
+        uploads = {}
+        mock_create_transfer_manager.return_value.upload.side_effect = record_upload(
+            uploads
+        )
+        hour = get_closed_hours_end(now()) - timedelta(hours=1)
+        observation_1 = ObservationFactory(
+            device_id="1", taken_at=hour + timedelta(minutes=1)
+        )
+        observation_2 = ObservationFactory(
+            device_id="1", taken_at=hour + timedelta(minutes=40)
+        )
+        observation_3 = ObservationFactory(
+            device_id="1", taken_at=hour + timedelta(minutes=61)
+        )
+        store_observations([observation_1])
+
+        def dump(until):
+            make_data_dump_to_s3(
+                DataDumpRequest(
+                    key="test-key",
+                    until=until,
+                    monitor_options=MonitorOptions(slug="test-slug", options={}),
+                )
+            )
+
+        # the hour is archived whole once it is closed
+        dump(until=hour + timedelta(minutes=30))
+        self.assertEqual({}, uploads)
+        store_observations([observation_2])
+        dump(until=hour + timedelta(minutes=60))
+        dump(until=hour + timedelta(minutes=90))
+        store_observations([observation_3])
+        dump(until=hour + timedelta(minutes=120))
+
+        self.assertEqual(
+            [
+                get_s3_dump_key("test-key", "1", observation_1.taken_at.timestamp()),
+                get_s3_dump_key("test-key", "1", observation_3.taken_at.timestamp()),
+            ],
+            list(uploads),
+        )
+        self.assertEqual(
+            [
+                [observation_1.patient_id, observation_2.patient_id],
+                [observation_3.patient_id],
+            ],
+            [
+                [json.loads(line)["patient-id"] for line in lines]
+                for lines in uploads.values()
+            ],
+        )
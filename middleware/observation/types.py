@@ -24,6 +24,14 @@ class ObservationID(str, Enum):
     WAVEFORM_RESPIRATION = "waveform_Respiration"
 
 
+WAVEFORM_OBSERVATION_IDS = {
+    ObservationID.WAVEFORM,
+    ObservationID.WAVEFORM_II,
+    ObservationID.WAVEFORM_PLETH,
+    ObservationID.WAVEFORM_RESPIRATION,
+}
+
+
 class Status(str, Enum):
     FINAL = "final"
     LEADS_OFF = "Message-Leads Off"
@@ -119,12 +127,19 @@ class StaticObservation(BaseModel):
     last_updated: datetime
 
 
+class LatestObservations(BaseModel):
+    observations: Dict[ObservationID, Observation]
+    last_updated: datetime
+
+
 class MonitorOptions(BaseModel):
     slug: str
     options: Optional[Dict]
 
 
 class DataDumpRequest(BaseModel):
-    data: List[Observation]
+    # prefix of the archived objects
     key: str
+    # observations taken before the UTC hour of this time are archived
+    until: datetime
     monitor_options: MonitorOptions
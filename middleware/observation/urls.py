@@ -4,5 +4,6 @@ from middleware.observation import views
 
 urlpatterns = [
     path("update_observations", views.update_observations),
+    path("update_observations/async", views.update_observations_async),
     path("devices/status", views.device_statuses),
 ]
@@ -1,24 +1,39 @@
+import gzip
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union
+import struct
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import chain, groupby
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import boto3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 from django.conf import settings
-from django.core.cache import cache
-from django.utils.timezone import make_aware, now
+from django.utils.timezone import is_naive, make_aware, now
+from django_redis import get_redis_connection
 from sentry_sdk.crons import capture_checkin
 from sentry_sdk.crons.consts import MonitorStatus
 
 from middleware.observation.types import (
+    WAVEFORM_OBSERVATION_IDS,
     DailyRoundObservation,
     DataDumpRequest,
     DeviceID,
+    LatestObservations,
     Observation,
     ObservationID,
     StaticObservation,
     Status,
+    WaveName,
 )
+from middleware.redis_manager import redis_manager
+from middleware.utils import group_by
 
 logger = logging.getLogger(__name__)
 
@@ -211,8 +226,30 @@ def is_valid(observation: Observation):
 def get_vitals_from_observations(ip_address: str):
     logger.info("Getting vitals from observations for the asset: %s", ip_address)
 
-    observation = get_static_observations(device_id=ip_address)
+    return generate_daily_round_observation(
+        ip_address, get_latest_observations(device_id=ip_address)
+    )
+
+
+def get_vitals_for_devices(
+    device_ids: List[DeviceID],
+) -> Dict[DeviceID, Optional[DailyRoundObservation]]:
+    """
+    Get the vitals of many devices reading their latest observations in a
+    single round trip
+    """
+    logger.info("Getting vitals from observations for %s devices", len(device_ids))
 
+    latest_observations = get_latest_observations_for_devices(device_ids)
+    return {
+        device_id: generate_daily_round_observation(device_id, observation)
+        for device_id, observation in latest_observations.items()
+    }
+
+
+def generate_daily_round_observation(
+    ip_address: str, observation: Optional[LatestObservations]
+) -> Optional[DailyRoundObservation]:
     if not observation:
         logger.info(
             "Returning as observations is stale or empty for device id : %s", ip_address
@@ -289,40 +326,267 @@ def get_value_from_data(
         return observation.value
 
 
-def extract_datetime(key):
-    # Split the string to get the timestamp part
-    timestamp_str = key.split("_", 1)[1]
-    # Convert the string to a datetime object
-    return datetime.fromisoformat(timestamp_str)
+WAVEFORM_FRAME_VERSION = 1
+WAVEFORM_FRAME_HEADER = struct.Struct("<BBffffdI")
+WAVE_NAME_CODES = {wave_name: code for code, wave_name in enumerate(WaveName)}
+UNKNOWN_WAVE_NAME_CODE = 255
+OBSERVATION_WAVE_NAMES = {
+    ObservationID.WAVEFORM_II: WaveName.II,
+    ObservationID.WAVEFORM_PLETH: WaveName.PLETH,
+    ObservationID.WAVEFORM_RESPIRATION: WaveName.RESPIRATION,
+}
+INT16_MIN, INT16_MAX = -(2**15), 2**15 - 1
 
 
-def get_observations_from_redis():
-    observation_keys = cache.keys(f"{settings.REDIS_OBSERVATIONS_KEY}*")
+def encode_json_array(fragments: List[str]) -> str:
+    return f"[{','.join(fragments)}]"
 
-    sorted_keys = sorted(observation_keys, key=extract_datetime)
-    observations = []
-    for key in sorted_keys:
-        observations.extend(cache.get(key))
-    return observations
 
+class ObservationFragments(tuple):
+    """
+    The encoded observations of a broadcast as (observation id, fragment)
+    pairs, the id is None for waveforms. It is immutable, so the in-memory
+    channel layer shares it between the subscribers instead of deep copying
+    it for each of them, the redis layers serialize it as a list.
+    """
 
-def get_static_observations(device_id: DeviceID):
-    observations = get_observations_from_redis()
-    stale_time = now() - timedelta(minutes=settings.UPDATE_INTERVAL)
+    def __deepcopy__(self, memo):
+        return self
 
-    # last one hour data matching the device id
-    valid_observations: List[Observation] = []
-    if not observations:
-        logger.info(" No observations for device id : %s stored in redis ", device_id)
+
+def encode_waveform_samples(data: str) -> array:
+    values = data.split()
+    try:
+        samples = array("h", map(int, values))
+    except (ValueError, OverflowError):
+        samples = array(
+            "h", (max(INT16_MIN, min(INT16_MAX, round(float(v)))) for v in values)
+        )
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return samples
+
+
+def encode_waveform_frame(observation: Observation) -> Optional[bytes]:
+    """
+    Encode a waveform observation as a binary frame, a little endian header
+
+        version          uint8
+        wave name        uint8   index in WaveName, 255 if unknown
+        sampling rate    float32
+        data baseline    float32
+        data low limit   float32
+        data high limit  float32
+        date time        float64 epoch secs
+        sample count     uint32
+
+    followed by the samples as int16. Frames are self delimiting, so the
+    frames of a batch can be sent as a single concatenated message.
+    """
+    if not observation.data:
         return None
-    for observation in observations:
-        parsed_observation = Observation.model_validate(observation)
 
-        if (
-            parsed_observation.taken_at > stale_time
-        ) and parsed_observation.device_id == device_id:
-            valid_observations.append(parsed_observation)
+    wave_name = observation.wave_name or OBSERVATION_WAVE_NAMES.get(
+        observation.observation_id
+    )
+    date_time = observation.date_time
+    if is_naive(date_time):
+        date_time = make_aware(date_time)
+
+    try:
+        samples = encode_waveform_samples(observation.data)
+        header = WAVEFORM_FRAME_HEADER.pack(
+            WAVEFORM_FRAME_VERSION,
+            WAVE_NAME_CODES.get(wave_name, UNKNOWN_WAVE_NAME_CODE),
+            float(observation.sampling_rate or 0),
+            observation.data_baseline or 0,
+            observation.data_low_limit or 0,
+            observation.data_high_limit or 0,
+            date_time.timestamp(),
+            len(samples),
+        )
+    except (ValueError, struct.error):
+        logger.warning(
+            "Skipping malformed waveform from device id: %s", observation.device_id
+        )
+        return None
+    return header + samples.tobytes()
+
+
+def get_observations_key(device_id: DeviceID) -> str:
+    return f"{settings.REDIS_OBSERVATIONS_KEY}:{device_id}"
+
+
+def get_observation_devices_key() -> str:
+    return f"{settings.REDIS_OBSERVATIONS_KEY}:devices"
+
+
+def get_latest_observations_key(device_id: DeviceID) -> str:
+    return f"{settings.REDIS_OBSERVATIONS_KEY}:latest:{device_id}"
+
+
+def get_group_subscribers_key(group: str) -> str:
+    return f"{settings.REDIS_OBSERVATIONS_KEY}:subscribers:{group}"
+
+
+async def add_group_subscriber(group: str, channel_name: str):
+    """
+    Record a websocket subscribed to an observation group, so senders skip
+    the messages of the groups nobody subscribed to. Subscriptions are scored
+    by their last refresh, the ones of a process that died expire.
+    """
+    ttl = settings.OBSERVATIONS_WS_SUBSCRIPTION_TTL
+    key = get_group_subscribers_key(group)
+    current_time = time.time()
+    pipeline = redis_manager.get_async_pipeline()
+    pipeline.zadd(key, {channel_name: current_time})
+    pipeline.zremrangebyscore(key, "-inf", current_time - ttl)
+    pipeline.expire(key, ttl)
+    await pipeline.execute()
+
+
+async def remove_group_subscriber(group: str, channel_name: str):
+    await redis_manager.get_async_client().zrem(
+        get_group_subscribers_key(group), channel_name
+    )
+
+
+def queue_group_subscriber_counts(pipeline, groups: List[str]):
+    min_score = time.time() - settings.OBSERVATIONS_WS_SUBSCRIPTION_TTL
+    for group in groups:
+        pipeline.zcount(get_group_subscribers_key(group), min_score, "+inf")
+
+
+# field of the latest observations hash holding the last write of the device
+LATEST_TAKEN_AT_FIELD = "taken_at"
+
+
+def serialize_observation(observation: Observation) -> str:
+    return observation.model_dump_json(by_alias=True)
+
+
+def serialize_observation_member(observation: Observation) -> str:
+    """
+    Serialize an observation as a member of the history of its device, with
+    its `taken_at` so identical readings taken at different times stay
+    distinct members instead of collapsing into the latest one
+    """
+    serialized = serialize_observation(observation)
+    # appended to the dumped object rather than dumping a dict, which is slower
+    return f'{serialized[:-1]},"taken_at":"{observation.taken_at.isoformat()}"}}'
+
+
+def deserialize_observation(member: bytes, score: float) -> Observation:
+    # validating the raw json in pydantic-core is cheaper than decoding it to
+    # python objects first, or than building the model through model_construct
+    observation = Observation.model_validate_json(member)
+    # the score is the timestamp the history is ordered and trimmed by
+    observation.taken_at = datetime.fromtimestamp(score, tz=timezone.utc)
+    return observation
+
+
+def store_observations(observations: List[Observation], pipeline=None):
+    """
+    Store observations in a sorted set per device scored by `taken_at`.
 
+    A sorted set of device ids scored by their last write is kept alongside,
+    so readers that need every device never have to scan the keyspace, and a
+    hash per device with the latest vital of each observation id, so current
+    vitals are read without going through the history.
+
+    pipeline: if given, the writes are queued on it and the caller executes it
+    """
+    if not observations:
+        return
+
+    retention = settings.OBSERVATIONS_RETENTION
+    current_time = now().timestamp()
+    expire_before = current_time - retention
+
+    execute = pipeline is None
+    if execute:
+        pipeline = redis_manager.get_pipeline()
+    for device_id, observation_list in group_by(
+        data=observations, key="device_id"
+    ).items():
+        key = get_observations_key(device_id)
+        pipeline.zadd(
+            key,
+            {
+                serialize_observation_member(
+                    observation
+                ): observation.taken_at.timestamp()
+                for observation in observation_list
+            },
+        )
+        pipeline.zremrangebyscore(key, "-inf", expire_before)
+        pipeline.expire(key, retention)
+        pipeline.zadd(get_observation_devices_key(), {device_id: current_time})
+
+        latest: Dict[ObservationID, Observation] = {}
+        for observation in observation_list:
+            if observation.observation_id in WAVEFORM_OBSERVATION_IDS:
+                continue
+            previous = latest.get(observation.observation_id)
+            if (
+                previous is None
+                or previous.taken_at.timestamp() <= observation.taken_at.timestamp()
+            ):
+                latest[observation.observation_id] = observation
+        latest_key = get_latest_observations_key(device_id)
+        pipeline.hset(
+            latest_key,
+            mapping={
+                **{
+                    observation_id.value: serialize_observation(observation)
+                    for observation_id, observation in latest.items()
+                },
+                LATEST_TAKEN_AT_FIELD: max(
+                    observation.taken_at.timestamp() for observation in observation_list
+                ),
+            },
+        )
+        pipeline.expire(latest_key, retention)
+
+    pipeline.zremrangebyscore(get_observation_devices_key(), "-inf", expire_before)
+    if execute:
+        pipeline.execute()
+
+
+def get_observation_device_ids() -> List[DeviceID]:
+    redis = get_redis_connection("default")
+    return [
+        device_id.decode()
+        for device_id in redis.zrange(get_observation_devices_key(), 0, -1)
+    ]
+
+
+def get_observations_from_redis(
+    device_id: DeviceID,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[Observation]:
+    """
+    Get the observations of a device taken between `since` and `until`,
+    ordered by `taken_at`.
+    """
+    redis = get_redis_connection("default")
+    entries = redis.zrangebyscore(
+        get_observations_key(device_id),
+        since.timestamp() if since else "-inf",
+        until.timestamp() if until else "+inf",
+        withscores=True,
+    )
+    return [deserialize_observation(member, score) for member, score in entries]
+
+
+def get_static_observations(device_id: DeviceID):
+    stale_time = now() - timedelta(minutes=settings.UPDATE_INTERVAL)
+
+    # last one hour data matching the device id
+    valid_observations = get_observations_from_redis(
+        device_id=device_id, since=stale_time
+    )
     if not valid_observations:
         logger.info(
             " No observations Valid observations for device id : %s stored in redis ",
@@ -332,6 +596,51 @@ def get_static_observations(device_id: DeviceID):
     return generate_static_observations(observation_list=valid_observations)
 
 
+def get_latest_observations(device_id: DeviceID) -> Optional[LatestObservations]:
+    """
+    Get the latest vital of each observation id of a device, None if the
+    device has not written since `UPDATE_INTERVAL`
+    """
+    redis = get_redis_connection("default")
+    return load_latest_observations(
+        device_id, redis.hgetall(get_latest_observations_key(device_id))
+    )
+
+
+def get_latest_observations_for_devices(
+    device_ids: List[DeviceID],
+) -> Dict[DeviceID, Optional[LatestObservations]]:
+    pipeline = redis_manager.get_pipeline()
+    for device_id in device_ids:
+        pipeline.hgetall(get_latest_observations_key(device_id))
+    return {
+        device_id: load_latest_observations(device_id, snapshot)
+        for device_id, snapshot in zip(device_ids, pipeline.execute())
+    }
+
+
+def load_latest_observations(
+    device_id: DeviceID, snapshot: Dict[bytes, bytes]
+) -> Optional[LatestObservations]:
+    taken_at = snapshot.pop(LATEST_TAKEN_AT_FIELD.encode(), None)
+    stale_time = now() - timedelta(minutes=settings.UPDATE_INTERVAL)
+    if not taken_at or float(taken_at) < stale_time.timestamp():
+        logger.info(
+            "No recent observations stored in redis for device id : %s", device_id
+        )
+        return None
+
+    return LatestObservations(
+        observations={
+            ObservationID(observation_id.decode()): Observation.model_validate_json(
+                observation
+            )
+            for observation_id, observation in snapshot.items()
+        },
+        last_updated=datetime.fromtimestamp(float(taken_at), tz=timezone.utc),
+    )
+
+
 def generate_static_observations(observation_list: List[Observation]):
     observations_dict = {}
     for observation in observation_list:
@@ -346,21 +655,189 @@ def generate_static_observations(observation_list: List[Observation]):
     )
 
 
-def get_data_for_s3_dump():
-    observations = get_observations_from_redis()
-    stale_time = now() - timedelta(minutes=settings.UPDATE_INTERVAL)
+def iter_observations_from_redis(
+    device_id: DeviceID,
+    until: datetime,
+    batch_size: int,
+    after: Optional[float] = None,
+) -> Iterator[Tuple[bytes, float]]:
+    """
+    Iterate over the serialized observations of a device scored after
+    `after` and taken up to `until` with their scores, reading `batch_size`
+    of them per request. Pages are keyed by score rather than offset, so
+    trimming the head of the set while iterating does not skip any.
+    """
+    redis = get_redis_connection("default")
+    key = get_observations_key(device_id)
+    min_score = "-inf" if after is None else f"({after!r}"
+    offset = 0
+    while True:
+        entries = redis.zrangebyscore(
+            key,
+            min_score,
+            until.timestamp(),
+            start=offset,
+            num=batch_size,
+            withscores=True,
+        )
+        yield from entries
+        if len(entries) < batch_size:
+            return
+
+        # the next page starts at the last score, skipping the members with
+        # that score which were already read
+        last_score = entries[-1][1]
+        ties = 0
+        for _, score in reversed(entries):
+            if score != last_score:
+                break
+            ties += 1
+        offset = offset + ties if min_score == last_score else ties
+        min_score = last_score
+
+
+def get_s3_dump_key(prefix: str, device_id: DeviceID, first_score: float) -> str:
+    # objects are partitioned by device and hour, named by their first score
+    hour = datetime.fromtimestamp(first_score, tz=timezone.utc)
+    return (
+        f"{prefix}/device={device_id}/date={hour:%Y-%m-%d}/hour={hour:%H}/"
+        f"{first_score:.6f}.ndjson.gz"
+    )
 
-    if not observations:
-        return None
-    observation_data_to_dump: List[Observation] = []
 
-    # for makimg dumps we just use all the stale data
-    for observation in observations:
-        parsed_observation = Observation.model_validate(observation)
-        if parsed_observation.taken_at < stale_time:
-            observation_data_to_dump.append(parsed_observation)
+@lru_cache(maxsize=None)
+def get_s3_client():
+    """
+    S3 client shared by the process, created on first use so that every
+    worker process builds its own connection pool after forking
+    """
+    start = time.perf_counter()
+    s3 = boto3.client(
+        "s3",
+        aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+        endpoint_url=settings.S3_ENDPOINT_URL if settings.S3_ENDPOINT_URL else None,
+        config=Config(
+            max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.S3_CONNECT_TIMEOUT,
+            read_timeout=settings.S3_READ_TIMEOUT,
+            retries={"max_attempts": settings.S3_MAX_ATTEMPTS, "mode": "standard"},
+        ),
+    )
+    logger.info("Created S3 client in %.3fs", time.perf_counter() - start)
+    return s3
+
+
+@lru_cache(maxsize=None)
+def get_s3_transfer_manager():
+    return create_transfer_manager(
+        get_s3_client(),
+        TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_THRESHOLD,
+            max_concurrency=settings.S3_MAX_POOL_CONNECTIONS,
+        ),
+    )
 
-    return observation_data_to_dump
+
+def upload_observations_to_s3(
+    transfer_manager, key: str, members: Iterable[bytes]
+) -> int:
+    """
+    Upload serialized observations as gzipped newline delimited JSON, the
+    archive is spooled to disk past `S3_DUMP_SPOOL_SIZE` and sent in parts
+    past `S3_MULTIPART_THRESHOLD`, returns the number of observations
+    """
+    count = 0
+    with SpooledTemporaryFile(max_size=settings.S3_DUMP_SPOOL_SIZE) as file:
+        with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+            for member in members:
+                archive.write(member)
+                archive.write(b"\n")
+                count += 1
+        file.seek(0)
+        transfer_manager.upload(
+            file,
+            settings.S3_BUCKET_NAME,
+            key,
+            extra_args={
+                "ContentType": "application/x-ndjson",
+                "ContentEncoding": "gzip",
+            },
+        ).result()
+    return count
+
+
+def get_closed_hours_end(until: datetime) -> datetime:
+    """
+    Get the start of the UTC hour of `until`, the hours before it are closed
+    and archived whole, so every hour of a device is a single object
+    """
+    if is_naive(until):
+        until = make_aware(until, timezone.utc)
+    return until.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def get_s3_dump_watermark_key(device_id: DeviceID) -> str:
+    return f"{settings.REDIS_OBSERVATIONS_KEY}:archived:{device_id}"
+
+
+def get_s3_dump_watermarks(device_ids: List[DeviceID]) -> Dict[DeviceID, float]:
+    """
+    Get the score up to which the observations of each device were archived
+    """
+    if not device_ids:
+        return {}
+    redis = get_redis_connection("default")
+    watermarks = redis.mget(
+        [get_s3_dump_watermark_key(device_id) for device_id in device_ids]
+    )
+    return {
+        device_id: float(watermark)
+        for device_id, watermark in zip(device_ids, watermarks)
+        if watermark
+    }
+
+
+def set_s3_dump_watermark(device_id: DeviceID, until: datetime):
+    # the watermark outlives the history it covers, see `store_observations`
+    redis = get_redis_connection("default")
+    redis.set(
+        get_s3_dump_watermark_key(device_id),
+        repr(until.timestamp()),
+        ex=settings.OBSERVATIONS_RETENTION,
+    )
+
+
+def dump_device_observations_to_s3(
+    transfer_manager,
+    prefix: str,
+    device_id: DeviceID,
+    until: datetime,
+    after: Optional[float] = None,
+) -> int:
+    """
+    Stream the observations of a device scored after `after` and taken up to
+    `until` to S3, one object per hour, returns the number of observations
+    uploaded. Objects are named by their first score, so a window uploaded
+    again after a failure overwrites its objects instead of duplicating them.
+    """
+    entries = iter_observations_from_redis(
+        device_id=device_id,
+        until=until,
+        batch_size=settings.S3_DUMP_BATCH_SIZE,
+        after=after,
+    )
+    count = 0
+    # entries are ordered by score, so every hour is a single run of them
+    for _, hour_entries in groupby(entries, key=lambda entry: int(entry[1] // 3600)):
+        first_member, first_score = next(hour_entries)
+        count += upload_observations_to_s3(
+            transfer_manager,
+            key=get_s3_dump_key(prefix, device_id, first_score),
+            members=chain([first_member], (member for member, _ in hour_entries)),
+        )
+    return count
 
 
 def make_data_dump_to_s3(request: DataDumpRequest):
@@ -374,25 +851,35 @@ def make_data_dump_to_s3(request: DataDumpRequest):
         )
 
     try:
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
-            endpoint_url=settings.S3_ENDPOINT_URL if settings.S3_ENDPOINT_URL else None,
-        )
+        start = time.perf_counter()
+        transfer_manager = get_s3_transfer_manager()
+        client_time = time.perf_counter() - start
         if not settings.S3_BUCKET_NAME:
             raise Exception("S3 Bucket Name not found")
-        data = [
-            observation.model_dump(mode="json", by_alias=True)
-            for observation in request.data
-        ]
-        s3.put_object(
-            Bucket=settings.S3_BUCKET_NAME,
-            Key=request.key,
-            Body=data,
-            ContentType="application/json",
+        # every observation is archived once, each run picks up from the
+        # watermark of the device left by the last successful one
+        until = get_closed_hours_end(request.until)
+        device_ids = get_observation_device_ids()
+        watermarks = get_s3_dump_watermarks(device_ids)
+        count = 0
+        for device_id in device_ids:
+            if watermarks.get(device_id, -1) >= until.timestamp():
+                continue
+            count += dump_device_observations_to_s3(
+                transfer_manager,
+                prefix=request.key,
+                device_id=device_id,
+                until=until,
+                after=watermarks.get(device_id),
+            )
+            set_s3_dump_watermark(device_id, until)
+        logger.info(
+            "Successfully uploaded %s observations to S3 in %.3fs, "
+            "getting the client took %.3fs",
+            count,
+            time.perf_counter() - start - client_time,
+            client_time,
         )
-        logger.info("Successfully uploaded data to S3")
 
         if request.monitor_options and check_in_id:
             capture_checkin(
@@ -1,37 +1,61 @@
-from datetime import datetime
-from typing import Dict, List
+import json
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from drf_spectacular.utils import extend_schema
+from pydantic import ValidationError
 from rest_framework import status
 from rest_framework.decorators import api_view, authentication_classes
 from rest_framework.response import Response
 
 from middleware.authentication import CareAuthentication
 from middleware.observation.types import (
+    WAVEFORM_OBSERVATION_IDS,
     DeviceID,
     Observation,
     ObservationID,
     ObservationList,
     Status,
 )
+from middleware.observation.utils import (
+    ObservationFragments,
+    encode_json_array,
+    encode_waveform_frame,
+    get_latest_observations_key,
+    queue_group_subscriber_counts,
+    store_observations,
+)
 from middleware.redis_manager import redis_manager
-from middleware.types import StatusResponse
-from middleware.utils import group_by
-
-blood_pressure_data: Dict[DeviceID, Observation] = {}
+from middleware.types import StatusRangeRequest, StatusResponse, status_range_params
+from middleware.utils import group_by, group_send_all
 
 
 @extend_schema(
+    parameters=status_range_params,
     responses={200: StatusResponse},
     description="Get statuses for Monitor devices",
 )
 @api_view(["GET"])
 @authentication_classes([CareAuthentication])
 def device_statuses(request):
-    statuses = redis_manager.get_redis_items(settings.MONITOR_STATUS_KEY)
+    try:
+        query = StatusRangeRequest.model_validate(request.query_params.dict())
+    except ValidationError as exc:
+        return Response(
+            {"error": exc.errors(include_url=False, include_context=False)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    statuses = redis_manager.get_time_series(
+        settings.MONITOR_STATUS_KEY,
+        since=query.since,
+        until=query.until,
+        limit=query.limit,
+    )
 
     return Response(statuses, status=status.HTTP_200_OK)
 
@@ -43,19 +67,75 @@ def device_statuses(request):
 )
 @api_view(["POST"])
 def update_observations(request):
-    data = flatten_observations(request.data)
+    try:
+        data = parse_observations_json(request.body)
+    except json.JSONDecodeError:
+        return Response({"error": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+    except ValidationError as exc:
+        return Response(
+            {"error": exc.errors(include_url=False, include_context=False)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
     store_and_send_observations(data)
 
     return Response({"result": "Successful"}, status=status.HTTP_200_OK)
 
 
+@csrf_exempt
+@require_POST
+async def update_observations_async(request):
+    """
+    Event loop native variant of `update_observations` for the ASGI server,
+    the request never leaves the loop to wait on Redis or the channel layer.
+    """
+    try:
+        data = parse_observations_json(request.body)
+        await astore_and_send_observations(data)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    except ValidationError as exc:
+        return JsonResponse(
+            {"error": exc.errors(include_url=False, include_context=False)},
+            status=400,
+        )
+
+    return JsonResponse({"result": "Successful"}, status=200)
+
+
 # As we dont get the blood pressure data every single time
 # in order to get continuous data we take the previous data
-# to store previous value of blood pressure per device_id
-def update_blood_pressure(observations: List[Observation]):
-    for observation in observations:
-        if observation.observation_id == ObservationID.BLOOD_PRESSURE:
-            blood_pressure_data[observation.device_id] = observation
+# from the latest observations of the device kept in redis
+def queue_blood_pressure_reads(
+    pipeline, grouped_observations: Dict[DeviceID, List[Observation]]
+) -> List[DeviceID]:
+    """
+    Queue reads of the last blood pressure of the devices without one in the
+    batch, returns the device ids in the order of the queued reads
+    """
+    device_ids = [
+        device_id
+        for device_id, observation_list in grouped_observations.items()
+        if not any(
+            observation.observation_id == ObservationID.BLOOD_PRESSURE
+            for observation in observation_list
+        )
+    ]
+    for device_id in device_ids:
+        pipeline.hget(
+            get_latest_observations_key(device_id),
+            ObservationID.BLOOD_PRESSURE.value,
+        )
+    return device_ids
+
+
+def get_blood_pressure_data(
+    device_ids: List[DeviceID], results: list
+) -> Dict[DeviceID, Observation]:
+    return {
+        device_id: Observation.model_validate_json(blood_pressure)
+        for device_id, blood_pressure in zip(device_ids, results)
+        if blood_pressure
+    }
 
 
 def flatten_observations(observations):
@@ -68,21 +148,27 @@ def flatten_observations(observations):
         return [observations]
 
 
-def store_and_send_observations(data: List):
-    observation_data: List[Observation] = ObservationList.model_validate(data).root
+def parse_observations_json(body: Union[str, bytes]) -> List[Observation]:
+    """
+    Parse a gateway payload straight from its raw JSON with the compiled
+    validator, skipping the intermediate python objects. Nested batches fall
+    back to decoding and flattening the payload first.
+    """
+    try:
+        return ObservationList.model_validate_json(body).root
+    except ValidationError:
+        data = flatten_observations(json.loads(body))
+        return ObservationList.model_validate(data).root
 
-    # store observations in redis
-    redis_manager.push_to_redis(
-        queue_name=settings.REDIS_OBSERVATIONS_KEY,
-        item=observation_data,
-        expiry=60 * 60 * 2,
-        curr_time=datetime.now(),
-    )
 
-    # store last blood pressure value for devices
-    update_blood_pressure(observation_data)
+def prepare_observations(data: List[Union[dict, Observation]]):
+    """
+    Validate the observations of a batch, group them by device and build the
+    device statuses for it. Already parsed observations are passed through
+    without being validated again.
+    """
+    observation_data: List[Observation] = ObservationList.model_validate(data).root
 
-    channel_layer = get_channel_layer()
     grouped_observations = group_by(data=observation_data, key="device_id")
     device_data: Dict[DeviceID, str] = {}
     for device_id, observation_list in grouped_observations.items():
@@ -90,21 +176,144 @@ def store_and_send_observations(data: List):
             device_data[device_id] = "down"
         else:
             device_data[device_id] = "up"
+
+    return observation_data, grouped_observations, device_data
+
+
+def build_observation_message(fragments: List[Tuple[Optional[str], str]]) -> dict:
+    return {
+        "type": "send_observation",
+        "text": encode_json_array([fragment for _, fragment in fragments]),
+        "observations": ObservationFragments(fragments),
+    }
+
+
+def get_optional_groups(
+    grouped_observations: Dict[DeviceID, List[Observation]],
+) -> List[str]:
+    # the groups of the vitals and waveform routes, their messages are only
+    # built when a websocket subscribed to them, see `add_group_subscriber`
+    return [
+        f"{prefix}{device_id}"
+        for device_id in grouped_observations
+        for prefix in ("vitals_ip_", "waveform_ip_")
+    ]
+
+
+def get_subscribed_groups(groups: List[str], results: list) -> Set[str]:
+    return {group for group, count in zip(groups, results) if count}
+
+
+def build_group_messages(
+    grouped_observations: Dict[DeviceID, List[Observation]],
+    blood_pressure_data: Dict[DeviceID, Observation],
+    subscribed_groups: Set[str],
+) -> Dict[str, dict]:
+    group_messages: Dict[str, dict] = {}
+    for device_id, observation_list in grouped_observations.items():
         last_blood_pressure_data = blood_pressure_data.get(device_id, None)
         if last_blood_pressure_data:
             observation_list.append(last_blood_pressure_data)
-        async_to_sync(channel_layer.group_send)(
-            f"ip_{device_id}",
-            {
-                "type": "send_observation",
-                "message": [
-                    observation.model_dump(mode="json", by_alias=True)
-                    for observation in observation_list
-                ],
-            },
-        )
+        send_vitals = f"vitals_ip_{device_id}" in subscribed_groups
+        send_waveforms = f"waveform_ip_{device_id}" in subscribed_groups
+
+        # each observation is encoded once and the frame of the group is
+        # joined once, subscribers send it as is, the fragments are only
+        # merged by observation id for throttled clients, waveforms are keyed
+        # by None as their chunks are never merged
+        fragments = []
+        vitals_fragments = []
+        waveform_frames = []
+        for observation in observation_list:
+            fragment = observation.model_dump_json(by_alias=True)
+            if observation.observation_id not in WAVEFORM_OBSERVATION_IDS:
+                entry = (observation.observation_id.value, fragment)
+                fragments.append(entry)
+                if send_vitals:
+                    vitals_fragments.append(entry)
+                continue
+            fragments.append((None, fragment))
+            if send_waveforms:
+                frame = encode_waveform_frame(observation)
+                if frame:
+                    waveform_frames.append(frame)
+
+        group_messages[f"ip_{device_id}"] = build_observation_message(fragments)
+        # clients receiving waveforms as binary frames get the vitals alone
+        if vitals_fragments:
+            group_messages[f"vitals_ip_{device_id}"] = build_observation_message(
+                vitals_fragments
+            )
+        if waveform_frames:
+            group_messages[f"waveform_ip_{device_id}"] = {
+                "type": "send_waveform",
+                "bytes": b"".join(waveform_frames),
+            }
+
+    return group_messages
+
+
+def queue_observation_writes(
+    pipeline,
+    observation_data: List[Observation],
+    grouped_observations: Dict[DeviceID, List[Observation]],
+    device_data: Dict[DeviceID, str],
+) -> Tuple[List[DeviceID], List[str]]:
+    """
+    Queue the blood pressure reads of the batch ahead of its writes, so they
+    see the state before it, followed by the subscriber counts of the
+    optional groups, returns the device ids and the groups of the reads
+    """
+    device_ids = queue_blood_pressure_reads(pipeline, grouped_observations)
+    groups = get_optional_groups(grouped_observations)
+    queue_group_subscriber_counts(pipeline, groups)
+    store_observations(observation_data, pipeline=pipeline)
+    redis_manager.add_to_time_series(
+        settings.MONITOR_STATUS_KEY, device_data, pipeline=pipeline
+    )
+    return device_ids, groups
+
+
+def build_batch_group_messages(
+    grouped_observations: Dict[DeviceID, List[Observation]],
+    device_ids: List[DeviceID],
+    groups: List[str],
+    results: list,
+) -> Dict[str, dict]:
+    return build_group_messages(
+        grouped_observations,
+        get_blood_pressure_data(device_ids, results),
+        get_subscribed_groups(groups, results[len(device_ids) :]),
+    )
+
+
+def store_and_send_observations(data: List[Union[dict, Observation]]):
+    observation_data, grouped_observations, device_data = prepare_observations(data)
+
+    # read the last blood pressures and store observations and device
+    # statuses in redis in a single round trip
+    pipeline = redis_manager.get_pipeline()
+    device_ids, groups = queue_observation_writes(
+        pipeline, observation_data, grouped_observations, device_data
+    )
+    results = pipeline.execute()
+
+    group_messages = build_batch_group_messages(
+        grouped_observations, device_ids, groups, results
+    )
+    async_to_sync(group_send_all)(get_channel_layer(), group_messages)
+
+
+async def astore_and_send_observations(data: List[Union[dict, Observation]]):
+    observation_data, grouped_observations, device_data = prepare_observations(data)
+
+    pipeline = redis_manager.get_async_pipeline()
+    device_ids, groups = queue_observation_writes(
+        pipeline, observation_data, grouped_observations, device_data
+    )
+    results = await pipeline.execute()
 
-    # add device statuses to redis
-    redis_manager.push_to_redis(
-        queue_name=settings.MONITOR_STATUS_KEY, item=device_data
+    group_messages = build_batch_group_messages(
+        grouped_observations, device_ids, groups, results
     )
+    await group_send_all(get_channel_layer(), group_messages)
@@ -1,45 +1,121 @@
-from datetime import datetime
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import List, Optional
 
-from django.core.cache import cache
+import redis.asyncio
+from django.conf import settings
+from django_redis import get_redis_connection
 
-from middleware.utils import get_current_truncated_utc_z
+TIME_SERIES_FORMAT = "%Y-%m-%dT%H:%M:00.000Z"
+
+
+def get_time_series_score(time: datetime) -> float:
+    # naive times are taken as UTC, like the times of the series
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time.timestamp()
 
 
 class RedisManager:
-    def push_to_redis(self, queue_name, item, expiry=60 * 30, curr_time=None):
+    def __init__(self):
+        self._async_client = None
+        self._async_client_loop = None
+
+    def get_async_client(self):
+        """
+        Get the asyncio client for the cache database. Its connections are
+        bound to an event loop, so it is created lazily once per running loop.
         """
-        Push an item to a Redis.
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = redis.asyncio.Redis.from_url(
+                settings.CACHES["default"]["LOCATION"]
+            )
+            self._async_client_loop = loop
+        return self._async_client
 
-        expiry: in secs
+    def get_async_pipeline(self):
+        return self.get_async_client().pipeline(transaction=False)
+
+    def get_pipeline(self):
+        """
+        Get a non transactional pipeline on the cache connection, to batch
+        writes into a single round trip.
         """
-        if not curr_time:
-            curr_time = get_current_truncated_utc_z()
+        return get_redis_connection("default").pipeline(transaction=False)
 
-        redis_key = f"{queue_name}_{curr_time}"
-        cache.set(redis_key, item, timeout=expiry)
+    def get_time_series_index_key(self, series: str) -> str:
+        return f"{series}:index"
 
-    def get_redis_items(self, queue_name):
+    def get_time_series_key(self, series: str, time: str) -> str:
+        return f"{series}:{time}"
+
+    def add_to_time_series(
+        self,
+        series: str,
+        item,
+        expiry: int = 60 * 30,
+        time: Optional[datetime] = None,
+        pipeline=None,
+    ):
         """
-        Get a range of items from the queue without removing them.
+        Store the item of a series for the minute of `time`, now by default, a
+        later item of the same minute replaces it. The minutes are indexed in
+        a sorted set scored by their timestamp.
+
+        expiry: in secs
+        pipeline: if given, the writes are queued on it instead of being sent
         """
+        minute = (time or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+        member = minute.strftime(TIME_SERIES_FORMAT)
+        score = minute.timestamp()
+        index_key = self.get_time_series_index_key(series)
 
-        search_pattern = f"{queue_name}*"
-        matching_keys = cache.keys(search_pattern)
-        # cleaned_keys = [key.decode().split(":", 2)[-1] for key in matching_keys]
-        sorted_keys = sorted(
-            matching_keys,
-            key=lambda k: datetime.strptime(
-                k.split(f"{queue_name}_")[1], "%Y-%m-%dT%H:%M:%S.%fZ"
-            ),
+        client = pipeline if pipeline is not None else self.get_pipeline()
+        client.set(
+            self.get_time_series_key(series, member), json.dumps(item), ex=expiry
         )
-        response_list = []
-        for sorted_key in sorted_keys:
-            statuses = cache.get(sorted_key)
-            if statuses:
-                timestamp = sorted_key.split(f"{queue_name}_")[1]
-                response_list.append({"time": timestamp, "status": statuses})
-
-        return response_list
+        client.zadd(index_key, {member: score})
+        # drop the minutes whose item expired
+        client.zremrangebyscore(index_key, "-inf", f"({score - expiry}")
+        client.expire(index_key, expiry)
+        if pipeline is None:
+            client.execute()
+
+    def get_time_series(
+        self,
+        series: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        Get the items of a series from `since` to `until` in time order, the
+        latest `limit` of them when given, in two round trips whatever the
+        size of the series.
+        """
+        client = get_redis_connection("default")
+        index_key = self.get_time_series_index_key(series)
+        min_score = get_time_series_score(since) if since else "-inf"
+        max_score = get_time_series_score(until) if until else "+inf"
+        if limit:
+            members = client.zrevrangebyscore(
+                index_key, max_score, min_score, start=0, num=limit
+            )[::-1]
+        else:
+            members = client.zrangebyscore(index_key, min_score, max_score)
+        if not members:
+            return []
+
+        times = [member.decode() for member in members]
+        items = client.mget([self.get_time_series_key(series, time) for time in times])
+        return [
+            {"time": time, "status": json.loads(item)}
+            for time, item in zip(times, items)
+            # the item may have expired before the index was trimmed
+            if item
+        ]
 
 
 # Create a global instance
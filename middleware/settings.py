@@ -169,13 +169,41 @@ REST_FRAMEWORK = {
 
 ASGI_APPLICATION = "middleware.asgi.application"
 
-CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+REDIS_URL = env("REDIS_URL", default="redis://redis:6379")
+
+# "memory" only fans out within a single process, running more than one
+# daphne process needs one of the redis backends. Groups are sharded across
+# the given hosts by a consistent hash of their names.
+CHANNEL_LAYER_BACKENDS = {
+    "memory": "channels.layers.InMemoryChannelLayer",
+    "redis": "channels_redis.core.RedisChannelLayer",
+    "redis_pubsub": "channels_redis.pubsub.RedisPubSubChannelLayer",
+}
+CHANNEL_LAYER_BACKEND = env("CHANNEL_LAYER_BACKEND", default="memory")
+CHANNEL_LAYER_REDIS_HOSTS = env.list(
+    "CHANNEL_LAYER_REDIS_HOSTS", default=[f"{REDIS_URL}/2"]
+)
+# max pending messages per channel, only used by the "redis" backend
+CHANNEL_LAYER_CAPACITY = env.int("CHANNEL_LAYER_CAPACITY", default=100)
+
+CHANNEL_LAYERS = {
+    "default": {"BACKEND": CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER_BACKEND]},
+}
+if CHANNEL_LAYER_BACKEND == "redis":
+    CHANNEL_LAYERS["default"]["CONFIG"] = {
+        "hosts": CHANNEL_LAYER_REDIS_HOSTS,
+        "capacity": CHANNEL_LAYER_CAPACITY,
+        # live vitals are useless once late, drop them rather than queue
+        "expiry": 10,
+    }
+elif CHANNEL_LAYER_BACKEND == "redis_pubsub":
+    CHANNEL_LAYERS["default"]["CONFIG"] = {"hosts": CHANNEL_LAYER_REDIS_HOSTS}
 
 
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": "redis://redis:6379/1",  # Redis server location
+        "LOCATION": f"{REDIS_URL}/1",  # Redis server location
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         },
@@ -189,12 +217,21 @@ CARE_API = env("CARE_API")
 FACILITY_ID = env("FACILITY_ID")
 CARE_JWK_URL = env("CARE_JWK_URL")
 CARE_VERIFY_TOKEN_URL = env("CARE_VERIFY_TOKEN_URL")
+# connections kept open to CARE per process
+CARE_POOL_SIZE = env.int("CARE_POOL_SIZE", default=10)
+CARE_MAX_RETRIES = env.int("CARE_MAX_RETRIES", default=3)
+# in secs
+CARE_RETRY_BACKOFF = env.float("CARE_RETRY_BACKOFF", default=0.5)
+CARE_CONNECT_TIMEOUT = env.float("CARE_CONNECT_TIMEOUT", default=5)
+CARE_READ_TIMEOUT = env.float("CARE_READ_TIMEOUT", default=30)
 
 
 JWKS = JsonWebKey.import_key_set(
     json.loads(base64.b64decode(env("JWKS_BASE64", default=generate_encoded_jwks())))
 )
-CELERY_BROKER_URL = "redis://redis:6379"
+# in secs, tokens sent to CARE are signed again this long before they expire
+JWT_REUSE_MARGIN = env.int("JWT_REUSE_MARGIN", default=10)
+CELERY_BROKER_URL = REDIS_URL
 
 
 ENABLE_UTC = True
@@ -206,10 +243,46 @@ CSRF_TRUSTED_ORIGINS = env.list("CSRF_TRUSTED_ORIGINS")
 # Observations
 REDIS_OBSERVATIONS_KEY = "observations"
 UPDATE_INTERVAL = env.int("UPDATE_INTERVAL", default=60)
+# in secs, patients of assets are looked up again when their asset changes
+PATIENT_LOOKUP_CACHE_TIMEOUT = env.int(
+    "PATIENT_LOOKUP_CACHE_TIMEOUT", default=60 * 60 * 6
+)
+# max monitors processed at once by automated daily rounds
+DAILY_ROUNDS_CONCURRENCY = env.int("DAILY_ROUNDS_CONCURRENCY", default=10)
+# in secs
+OBSERVATIONS_RETENTION = env.int("OBSERVATIONS_RETENTION", default=60 * 60 * 2)
+# max updates per sec pushed to an observations websocket, 0 for no limit,
+# clients may ask for a lower rate with ?max_rate=, updates in between are
+# coalesced so a lagging client does not build up a send queue
+OBSERVATIONS_WS_MAX_RATE = env.float("OBSERVATIONS_WS_MAX_RATE", default=10)
+# waveform chunks kept per throttled websocket, older ones are dropped
+OBSERVATIONS_WS_WAVEFORM_BUFFER = env.int("OBSERVATIONS_WS_WAVEFORM_BUFFER", default=30)
+# in secs, websockets refresh their subscription in redis at half of it, the
+# subscriptions of a process that died are dropped after it
+OBSERVATIONS_WS_SUBSCRIPTION_TTL = env.int(
+    "OBSERVATIONS_WS_SUBSCRIPTION_TTL", default=60 * 10
+)
 
 
 # Cameras
 WSDL_PATH = Path(onvif.__file__).parent.parent / "wsdl"
+# in secs, bounds every SOAP request to a camera
+CAMERA_TIMEOUT = env.float("CAMERA_TIMEOUT", default=5)
+# max cameras polled at once by the status sweep
+CAMERA_STATUS_CONCURRENCY = env.int("CAMERA_STATUS_CONCURRENCY", default=50)
+# in secs, cameras not polled by then are reported as down
+CAMERA_STATUS_DEADLINE = env.float("CAMERA_STATUS_DEADLINE", default=30)
+# in secs, max wait for a camera to end a move
+CAMERA_MOVE_TIMEOUT = env.float("CAMERA_MOVE_TIMEOUT", default=30)
+# in secs, the camera status is polled at growing intervals during a move
+CAMERA_MOVE_POLL_MIN_INTERVAL = env.float("CAMERA_MOVE_POLL_MIN_INTERVAL", default=0.05)
+CAMERA_MOVE_POLL_MAX_INTERVAL = env.float("CAMERA_MOVE_POLL_MAX_INTERVAL", default=0.5)
+# in secs, pooled camera controllers unused for this long are dropped
+CAMERA_POOL_IDLE_TIMEOUT = env.int("CAMERA_POOL_IDLE_TIMEOUT", default=1800)
+# in secs, pooled camera controllers unused for this long are health checked
+CAMERA_POOL_VALIDATE_AFTER = env.int("CAMERA_POOL_VALIDATE_AFTER", default=300)
+# connect to the ONVIF assets when the server starts
+CAMERA_POOL_WARM_ON_STARTUP = env.bool("CAMERA_POOL_WARM_ON_STARTUP", default=False)
 
 
 CAMERA_LOCK_KEY = "CAMERA_LOCK_KEY"
@@ -221,6 +294,17 @@ S3_ACCESS_KEY_ID = env("S3_ACCESS_KEY_ID")
 S3_SECRET_ACCESS_KEY = env("S3_SECRET_ACCESS_KEY")
 S3_ENDPOINT_URL = env("S3_ENDPOINT_URL")
 S3_BUCKET_NAME = env("S3_BUCKET_NAME")
+S3_MAX_POOL_CONNECTIONS = env.int("S3_MAX_POOL_CONNECTIONS", default=10)
+S3_MAX_ATTEMPTS = env.int("S3_MAX_ATTEMPTS", default=3)
+# in secs
+S3_CONNECT_TIMEOUT = env.float("S3_CONNECT_TIMEOUT", default=5)
+S3_READ_TIMEOUT = env.float("S3_READ_TIMEOUT", default=30)
+# observations read from redis per request while archiving
+S3_DUMP_BATCH_SIZE = env.int("S3_DUMP_BATCH_SIZE", default=1000)
+# bytes of a compressed archive part kept in memory before spilling to disk
+S3_DUMP_SPOOL_SIZE = env.int("S3_DUMP_SPOOL_SIZE", default=8 * 1024 * 1024)
+# archive parts larger than this are sent as multipart uploads
+S3_MULTIPART_THRESHOLD = env.int("S3_MULTIPART_THRESHOLD", default=8 * 1024 * 1024)
 
 
 # redis status keys
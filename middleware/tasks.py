@@ -1,14 +1,20 @@
 import logging
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from datetime import timedelta
 from typing import Dict, Optional
-from uuid import UUID
 
-import requests
 from celery import shared_task
 from django.conf import settings
-
-from middleware.camera.onvif_zeep_camera_controller import OnvifZeepCameraController
-from middleware.camera.types import CameraAsset
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from middleware.assets import asset_registry, sync_assets
+from middleware.camera.pool import (
+    CAMERA_CONNECTION_ERRORS,
+    camera_controller_pool,
+    get_camera_asset,
+)
+from middleware.care import care_client
 from middleware.models import Asset, AssetClasses
 from middleware.observation.types import (
     DailyRoundObservation,
@@ -17,91 +23,118 @@ from middleware.observation.types import (
     MonitorOptions,
 )
 from middleware.observation.utils import (
-    get_data_for_s3_dump,
-    get_vitals_from_observations,
+    get_vitals_for_devices,
     make_data_dump_to_s3,
 )
 from middleware.redis_manager import redis_manager
-from middleware.utils import _get_headers, file_automated_daily_rounds, get_patient_id
+from middleware.utils import (
+    _get_headers,
+    file_automated_daily_rounds,
+    get_patient_id,
+    invalidate_patient_ids,
+)
 
 logger = logging.getLogger(__name__)
 
+ASSET_CONFIG_VALIDATORS_KEY = "asset_config:validators"
+
 
 @shared_task
 def retrieve_asset_config():
     logger.info("Started Retrieving Assets Task")
-    response = requests.get(
+    headers = _get_headers()
+    # skip the sync when CARE reports that the asset configs are unchanged
+    validators = cache.get(ASSET_CONFIG_VALIDATORS_KEY) or {}
+    if validators.get("ETag"):
+        headers["If-None-Match"] = validators["ETag"]
+    if validators.get("Last-Modified"):
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+    response = care_client.get(
         f"{settings.CARE_URL}asset_config/?middleware_hostname={settings.HOST_NAME}",
-        headers=_get_headers(),
+        headers=headers,
     )
+    if response.status_code == 304:
+        logger.info("Asset configs are unchanged")
+        return
 
     response.raise_for_status()
     data = response.json()
 
-    logger.info("Fetched  Asset ids: %s", data)
-    fetched_ids = [UUID(asset["id"]) for asset in data]
-    existing_asset_ids = list(
-        Asset.objects.filter(deleted=False).values_list("id", flat=True)
-    )
-    logger.info("Existing  Asset ids: %s", existing_asset_ids)
-
-    missing_asset_ids = [
-        asset_id for asset_id in existing_asset_ids if asset_id not in fetched_ids
-    ]
+    logger.info("Fetched  Asset ids: %s", [asset["id"] for asset in data])
+    changed_asset_ids = sync_assets(data)
 
-    logger.info("Missing  Asset ids: %s", missing_asset_ids)
+    # patients looked up for changed assets may no longer be theirs
+    invalidate_patient_ids(changed_asset_ids)
 
-    # Mark missing assets as deleted
-    deleted_count = Asset.objects.filter(id__in=missing_asset_ids).delete()
+    cache.set(
+        ASSET_CONFIG_VALIDATORS_KEY,
+        {
+            header: response.headers[header]
+            for header in ("ETag", "Last-Modified")
+            if response.headers.get(header)
+        },
+        timeout=None,
+    )
 
-    logger.info("Deleted assets count: %s ", deleted_count)
 
-    for asset in data:
-        # Implement logic to create or update assets based on your model
-        new_asset, _ = Asset.objects.update_or_create(
-            id=str(asset["id"]), defaults=asset
+def file_monitor_daily_round(monitor: Asset, vitals: Optional[DailyRoundObservation]):
+    logger.info("Processing Monitor having id: %s", monitor.id)
+    consultation_id, patient_id, bed_id, asset_beds = get_patient_id(
+        external_id=monitor.id
+    )
+    if not consultation_id or not patient_id or not bed_id:
+        logger.error("Patient not found for the asset having id: %s", monitor.id)
+        return
+
+    logger.info("Vitals for Monitor having id:%s  is: %s", monitor.id, vitals)
+    if not vitals:
+        logger.info(
+            "Not filing Automated daily rounds for Monitor having id:%s  as vitals is : %s",
+            monitor.id,
+            vitals,
         )
+        return
+    file_automated_daily_rounds(
+        consultation_id=consultation_id,
+        asset_id=monitor.id,
+        vitals=vitals.model_dump(mode="json", exclude_none=True),
+    )
 
 
 @shared_task
 def automated_daily_rounds():
     logger.info("Started Automated daily rounds")
-    monitors = Asset.objects.filter(type=AssetClasses.HL7MONITOR.name, deleted=False)
+    monitors = asset_registry.filter_by_type(AssetClasses.HL7MONITOR.name)
     logger.info("Found %s monitors", len(monitors))
-    for monitor in monitors:
-        logger.info("Processing Monitor having id: %s", monitor.id)
-        consultation_id, patient_id, bed_id, asset_beds = get_patient_id(
-            external_id=monitor.id
-        )
-        if not consultation_id or not patient_id or not bed_id:
-            logger.error("Patient not found for the asset having id: %s", monitor.id)
-            return
-
-        vitals: Optional[DailyRoundObservation] = get_vitals_from_observations(
-            ip_address=monitor.ip_address
-        )
-        logger.info("Vitals for Monitor having id:%s  is: %s", monitor.id, vitals)
-        if not vitals:
-            logger.info(
-                "Not filing Automated daily rounds for Monitor having id:%s  as vitals is : %s",
-                monitor.id,
-                vitals,
-            )
-            return
-        file_automated_daily_rounds(
-            consultation_id=consultation_id,
-            asset_id=monitor.id,
-            vitals=vitals.model_dump(mode="json", exclude_none=True),
-        )
+    # the vitals of every monitor are read up front in a single round trip
+    vitals = get_vitals_for_devices([monitor.ip_address for monitor in monitors])
+    # monitors are processed concurrently, the pool size caps the requests
+    # in flight to CARE and a failing monitor does not stop the others
+    with ThreadPoolExecutor(max_workers=settings.DAILY_ROUNDS_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(
+                file_monitor_daily_round, monitor, vitals[monitor.ip_address]
+            ): monitor
+            for monitor in monitors
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception:
+                logger.exception(
+                    "Failed to file automated daily rounds for Monitor having id: %s",
+                    futures[future].id,
+                )
 
 
 @shared_task
 def observations_s3_dump():
-    data = get_data_for_s3_dump()
+    # the hours are archived once closed, the batches in flight at the end
+    # of an hour are stored first, and are kept in redis long after it
     make_data_dump_to_s3(
-        req=DataDumpRequest(
-            data=data,
-            key=f"{settings.HOST_NAME}/{datetime.now()}.json",
+        request=DataDumpRequest(
+            key=settings.HOST_NAME,
+            until=now() - timedelta(minutes=1),
             monitor_options=MonitorOptions(
                 slug="s3_observations_dump",
                 options={
@@ -115,22 +148,43 @@ def observations_s3_dump():
     )
 
 
+def get_camera_status(camera: Asset) -> str:
+    cam_request = get_camera_asset(camera)
+    try:
+        response = camera_controller_pool.get(cam_request).get_status()
+    except CAMERA_CONNECTION_ERRORS:
+        camera_controller_pool.invalidate(cam_request)
+        raise
+    if response and response.get("error") == "NO error":
+        return "up"
+    return "down"
+
+
 @shared_task
 def store_camera_statuses():
-    cameras = Asset.objects.filter(type=AssetClasses.ONVIF.name, deleted=False)
-    device_data: Dict[DeviceID, str] = {}
-    for camera in cameras:
-        cam_request = CameraAsset(
-            hostname=str(camera.ip_address),
-            port=int(camera.port),
-            username=str(camera.username),
-            password=str(camera.password),
-        )
-        cam = OnvifZeepCameraController(req=cam_request)
-        response = cam.get_status()
-        if response and response.get("error") == "NO error":
-            device_data[camera.ip_address] = "up"
-        else:
-            device_data[camera.ip_address] = "down"
-
-    redis_manager.push_to_redis(settings.CAMERA_STATUS_KEY, device_data)
+    cameras = asset_registry.filter_by_type(AssetClasses.ONVIF.name)
+    # every camera is reported, cameras that fail or miss the deadline are down
+    device_data: Dict[DeviceID, str] = {camera.ip_address: "down" for camera in cameras}
+    # cameras are polled concurrently, a slow or failing camera only affects
+    # its own status and the sweep is bounded by the deadline
+    executor = ThreadPoolExecutor(max_workers=settings.CAMERA_STATUS_CONCURRENCY)
+    try:
+        futures = {
+            executor.submit(get_camera_status, camera): camera for camera in cameras
+        }
+        done, not_done = wait(futures, timeout=settings.CAMERA_STATUS_DEADLINE)
+        for future in done:
+            try:
+                device_data[futures[future].ip_address] = future.result()
+            except Exception:
+                logger.warning(
+                    "Failed to get the status of Camera having id: %s",
+                    futures[future].id,
+                    exc_info=True,
+                )
+        if not_done:
+            logger.warning("Camera statuses timed out for %s cameras", len(not_done))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    redis_manager.add_to_time_series(settings.CAMERA_STATUS_KEY, device_data)
@@ -0,0 +1,70 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from middleware.assets import ASSET_REGISTRY_VERSION_KEY, AssetRegistry, sync_assets
+from middleware.models import Asset
+
+
+def asset_config(asset_id, **fields):
+    return {
+        "id": asset_id,
+        "name": f"Monitor {asset_id[-1]}",
+        "type": "HL7MONITOR",
+        "description": "",
+        "ip_address": f"192.168.1.{asset_id[-1]}",
+        **fields,
+    }
+
+
+class TestAssetSync(TestCase):
+    ids = [f"00000000-0000-0000-0000-00000000000{index}" for index in range(3)]
+
+    def test_sync_assets_writes_only_changes(self):
+        self.assertEqual(
+            2, len(sync_assets([asset_config(self.ids[0]), asset_config(self.ids[1])]))
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [], sync_assets([asset_config(self.ids[0]), asset_config(self.ids[1])])
+            )
+
+        changed = sync_assets(
+            [asset_config(self.ids[1], name="Renamed"), asset_config(self.ids[2])]
+        )
+        self.assertEqual({str(asset_id) for asset_id in changed}, set(self.ids))
+        self.assertEqual(
+            {self.ids[1]: "Renamed", self.ids[2]: "Monitor 2"},
+            {str(asset.id): asset.name for asset in Asset.objects.all()},
+        )
+
+    def test_asset_registry_is_refreshed_on_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_assets([asset_config(self.ids[0]), asset_config(self.ids[1])])
+        registry = AssetRegistry()
+        self.assertEqual(self.ids[0], str(registry.get(self.ids[0]).id))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids[1], str(registry.get_by_ip("192.168.1.1").id))
+            self.assertEqual(2, len(registry.filter_by_type("HL7MONITOR")))
+            self.assertIsNone(registry.get("not-an-id"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_assets([asset_config(self.ids[1], type="ONVIF")])
+        self.assertIsNone(registry.get(self.ids[0]))
+        self.assertEqual([], registry.filter_by_type("HL7MONITOR"))
+        self.assertEqual(1, len(registry.filter_by_type("ONVIF")))
+
+    def test_asset_registry_version_is_bumped_on_commit(self):
+        version = cache.get_or_set(ASSET_REGISTRY_VERSION_KEY, "initial", timeout=None)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            sync_assets([asset_config(self.ids[0])])
+            Asset.objects.filter(id=self.ids[0]).get().save()
+            # the saving transaction is still open
+            self.assertEqual(version, cache.get(ASSET_REGISTRY_VERSION_KEY))
+
+        self.assertEqual(2, len(callbacks))
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(version, cache.get(ASSET_REGISTRY_VERSION_KEY))
@@ -0,0 +1,24 @@
+from unittest import TestCase as UnitTest
+from unittest.mock import patch
+
+from django.test import override_settings
+
+from middleware.care import CareClient
+
+
+class TestCareClient(UnitTest):
+    @override_settings(CARE_POOL_SIZE=4, CARE_CONNECT_TIMEOUT=1, CARE_READ_TIMEOUT=2)
+    def test_requests_share_a_pooled_session(self):
+        client = CareClient()
+        session = client.get_session()
+        self.assertIs(session, client.get_session())
+        self.assertEqual(4, session.get_adapter("https://care")._pool_maxsize)
+
+        with patch.object(session, "request") as mock_request:
+            client.get("https://care/api/v1/asset_config/")
+            client.post("https://care/api/v1/verify/", timeout=10)
+
+        self.assertEqual(
+            [(1, 2), 10],
+            [call.kwargs["timeout"] for call in mock_request.call_args_list],
+        )
@@ -0,0 +1,120 @@
+from threading import Event
+from unittest import TestCase as UnitTest
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import override_settings
+from requests import HTTPError
+
+from middleware.observation.types import DailyRoundObservation
+from middleware.tasks import (
+    automated_daily_rounds,
+    retrieve_asset_config,
+    store_camera_statuses,
+)
+from middleware.test.test_assets import asset_config
+
+ASSET_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class TestAutomatedDailyRounds(UnitTest):
+    @patch("middleware.tasks.file_automated_daily_rounds")
+    @patch("middleware.tasks.get_vitals_for_devices")
+    @patch("middleware.tasks.get_patient_id")
+    @patch("middleware.tasks.asset_registry")
+    def test_monitors_are_processed_independently(
+        self,
+        mock_asset_registry,
+        mock_get_patient_id,
+        mock_get_vitals_for_devices,
+        mock_file_automated_daily_rounds,
+    ):
+        monitors = [
+            MagicMock(id=str(index), ip_address=f"192.168.1.{index}")
+            for index in range(3)
+        ]
+        mock_asset_registry.filter_by_type.return_value = monitors
+        patients = {
+            "0": HTTPError("CARE is down"),
+            "1": (None, None, None, None),
+            "2": ("consultation", "patient", "bed", []),
+        }
+
+        def get_patient_id(external_id):
+            patient = patients[external_id]
+            if isinstance(patient, Exception):
+                raise patient
+            return patient
+
+        mock_get_patient_id.side_effect = get_patient_id
+        mock_get_vitals_for_devices.return_value = {
+            monitor.ip_address: DailyRoundObservation(spo2=98) for monitor in monitors
+        }
+
+        automated_daily_rounds()
+
+        self.assertEqual(3, mock_get_patient_id.call_count)
+        mock_get_vitals_for_devices.assert_called_once_with(
+            [monitor.ip_address for monitor in monitors]
+        )
+        mock_file_automated_daily_rounds.assert_called_once_with(
+            consultation_id="consultation",
+            asset_id="2",
+            vitals={"spo2": 98.0, "bp": {}},
+        )
+
+
+class TestCameraStatuses(UnitTest):
+    @override_settings(CAMERA_STATUS_DEADLINE=0.5)
+    @patch("middleware.tasks.redis_manager")
+    @patch("middleware.tasks.get_camera_status")
+    @patch("middleware.tasks.asset_registry")
+    def test_every_camera_is_reported(
+        self, mock_asset_registry, mock_get_camera_status, mock_redis_manager
+    ):
+        cameras = [
+            MagicMock(id=str(index), ip_address=f"192.168.1.{index}")
+            for index in range(3)
+        ]
+        mock_asset_registry.filter_by_type.return_value = cameras
+        unreachable = Event()
+
+        def get_camera_status(camera):
+            if camera.id == "0":
+                raise ConnectionError("camera is down")
+            if camera.id == "1":
+                unreachable.wait(timeout=5)
+            return "up"
+
+        mock_get_camera_status.side_effect = get_camera_status
+
+        try:
+            store_camera_statuses()
+        finally:
+            unreachable.set()
+
+        mock_redis_manager.add_to_time_series.assert_called_once_with(
+            "camera_statuses",
+            {"192.168.1.0": "down", "192.168.1.1": "down", "192.168.1.2": "up"},
+        )
+
+
+class TestRetrieveAssetConfig(UnitTest):
+    @patch("middleware.tasks.invalidate_patient_ids")
+    @patch("middleware.tasks.sync_assets")
+    @patch("middleware.tasks.care_client.get")
+    def test_retrieve_asset_config_is_conditional(
+        self, mock_get, mock_sync_assets, mock_invalidate_patient_ids
+    ):
+        cache.clear()
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {"ETag": '"v1"'}
+        mock_get.return_value.json.return_value = [asset_config(ASSET_ID)]
+        retrieve_asset_config()
+
+        mock_get.return_value.status_code = 304
+        retrieve_asset_config()
+
+        self.assertEqual('"v1"', mock_get.call_args.kwargs["headers"]["If-None-Match"])
+        mock_sync_assets.assert_called_once()
+        mock_invalidate_patient_ids.assert_called_once()
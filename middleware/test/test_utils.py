@@ -0,0 +1,63 @@
+from unittest import TestCase as UnitTest
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from middleware.utils import (
+    _jwt_cache,
+    get_cached_jwt,
+    get_patient_id,
+    invalidate_patient_ids,
+)
+
+
+class TestPatientLookup(UnitTest):
+    def setUp(self):
+        cache.clear()
+
+    @patch("middleware.utils.care_client.get")
+    def test_get_patient_id_is_cached(self, mock_get):
+        mock_get.return_value.json.return_value = {
+            "consultation_id": "consultation",
+            "patient_id": "patient",
+            "bed_id": "bed",
+            "asset_beds": [],
+        }
+
+        patient = get_patient_id(external_id="1")
+        self.assertEqual(patient, get_patient_id(external_id="1"))
+        self.assertEqual(1, mock_get.call_count)
+
+        invalidate_patient_ids(["1"])
+        get_patient_id(external_id="1")
+        self.assertEqual(2, mock_get.call_count)
+
+    @patch("middleware.utils.care_client.get")
+    def test_get_patient_id_without_patient_is_not_cached(self, mock_get):
+        mock_get.return_value.json.return_value = {}
+
+        get_patient_id(external_id="1")
+        get_patient_id(external_id="1")
+
+        self.assertEqual(2, mock_get.call_count)
+
+
+class TestCareTokens(UnitTest):
+    def setUp(self):
+        _jwt_cache.clear()
+
+    @patch("middleware.utils.generate_jwt", side_effect=lambda claims, exp: "token")
+    def test_get_cached_jwt(self, mock_generate_jwt):
+        get_cached_jwt(claims={"asset_id": "1"})
+        get_cached_jwt(claims={"asset_id": "1"})
+        self.assertEqual(1, mock_generate_jwt.call_count)
+
+        get_cached_jwt(claims={"asset_id": "2"})
+        self.assertEqual(2, mock_generate_jwt.call_count)
+
+        with override_settings(JWT_REUSE_MARGIN=60):
+            _jwt_cache.clear()
+            get_cached_jwt(claims={"asset_id": "1"})
+            get_cached_jwt(claims={"asset_id": "1"})
+        self.assertEqual(4, mock_generate_jwt.call_count)
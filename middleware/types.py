@@ -1,6 +1,8 @@
 from datetime import datetime
+from typing import Optional
 
-from pydantic import BaseModel
+from drf_spectacular.utils import OpenApiParameter
+from pydantic import BaseModel, Field
 
 
 class StatusResponse(BaseModel):
@@ -8,6 +10,28 @@ class StatusResponse(BaseModel):
     status: dict[str, str]
 
 
+class StatusRangeRequest(BaseModel):
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    limit: Optional[int] = Field(default=None, gt=0)
+
+
+status_range_params = [
+    OpenApiParameter(
+        name="since", description="Earliest status time", required=False, type=str
+    ),
+    OpenApiParameter(
+        name="until", description="Latest status time", required=False, type=str
+    ),
+    OpenApiParameter(
+        name="limit",
+        description="Max statuses, the latest are returned",
+        required=False,
+        type=int,
+    ),
+]
+
+
 class VerifyTokenRequest(BaseModel):
     Token: str
 
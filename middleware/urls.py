@@ -52,4 +52,12 @@ websocket_urlpatterns = [
         r"observations/<str:ip_address>",
         consumers.observations.as_asgi(),
     ),
+    path(
+        r"observations/<str:ip_address>/waveform",
+        consumers.waveforms.as_asgi(),
+    ),
+    path(
+        r"cameras/<str:ip_address>/movements",
+        consumers.camera_movements.as_asgi(),
+    ),
 ]
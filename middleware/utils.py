@@ -1,16 +1,19 @@
+import asyncio
 import base64
 import json
 import logging
+import threading
 from datetime import datetime
-from typing import Any, Dict, List, TypeVar
+from typing import Any, Dict, List, Tuple, TypeVar
 from uuid import UUID
 
-import pytz
-import requests
 from authlib.jose import JsonWebKey, jwt
 from django.conf import settings
+from django.core.cache import cache
 from pydantic import BaseModel
 
+from middleware.care import care_client
+
 T = TypeVar("T", bound=BaseModel)
 logger = logging.getLogger(__name__)
 
@@ -30,6 +33,37 @@ def generate_jwt(claims=None, exp=60, jwks=None):
     return jwt.encode(header, payload, jwks).decode("utf-8")
 
 
+# signed tokens by their claims and lifetime, with the time they are reused until
+_jwt_cache: Dict[Tuple[int, Tuple], Tuple[str, float]] = {}
+_jwt_cache_lock = threading.Lock()
+JWT_CACHE_SIZE = 4096
+
+
+def get_cached_jwt(claims=None, exp=60) -> str:
+    """
+    Signed token for the claims, reused until `JWT_REUSE_MARGIN` secs before
+    it expires as the RSA signature dominates the cost of a CARE request
+    """
+    key = (exp, tuple(sorted((claims or {}).items())))
+    current_time = datetime.now().timestamp()
+    with _jwt_cache_lock:
+        cached = _jwt_cache.get(key)
+    if cached and cached[1] > current_time:
+        return cached[0]
+
+    token = generate_jwt(claims=claims, exp=exp)
+    reuse_until = int(current_time) + exp - settings.JWT_REUSE_MARGIN
+    with _jwt_cache_lock:
+        if len(_jwt_cache) >= JWT_CACHE_SIZE:
+            for cached_key, (_, cached_until) in list(_jwt_cache.items()):
+                if cached_until <= current_time:
+                    del _jwt_cache[cached_key]
+            if len(_jwt_cache) >= JWT_CACHE_SIZE:
+                _jwt_cache.clear()
+        _jwt_cache[key] = (token, reuse_until)
+    return token
+
+
 def generate_encoded_jwks():
     key = JsonWebKey.generate_key("RSA", 2048, is_private=True)
     key = key.as_dict(key.dumps_private_key(), alg="RS256")
@@ -41,7 +75,7 @@ def generate_encoded_jwks():
 
 def _get_headers(claims: dict = None) -> dict:
     return {
-        "Authorization": "Middleware_Bearer " + generate_jwt(claims=claims),
+        "Authorization": "Middleware_Bearer " + get_cached_jwt(claims=claims),
         "Content-Type": "application/json",
         "X-Facility-Id": settings.FACILITY_ID,
     }
@@ -58,13 +92,43 @@ def group_by(data: List[T], key: str) -> Dict[Any, List[T]]:
     return grouped_data
 
 
-def get_patient_id(external_id: UUID):
-    response = requests.get(
-        f"{settings.CARE_URL}consultation/patient_from_asset/?preset_name=monitor",
-        headers=_get_headers(claims={"asset_id": str(external_id)}),
+async def group_send_all(channel_layer, group_messages: Dict[str, dict]):
+    """
+    Send a message to each group concurrently, so a whole fan-out needs a
+    single hop onto the event loop from sync code.
+    """
+    await asyncio.gather(
+        *(
+            channel_layer.group_send(group, message)
+            for group, message in group_messages.items()
+        )
     )
-    response.raise_for_status()
-    data = response.json()
+
+
+def patient_id_cache_key(external_id: UUID) -> str:
+    return f"patient_from_asset:{external_id}"
+
+
+def invalidate_patient_ids(external_ids: List[UUID]):
+    if external_ids:
+        cache.delete_many([patient_id_cache_key(id) for id in external_ids])
+
+
+def get_patient_id(external_id: UUID):
+    # the patient of an asset rarely changes, lookups are cached until the
+    # asset changes in `retrieve_asset_config` or a daily round is refused
+    cache_key = patient_id_cache_key(external_id)
+    data = cache.get(cache_key)
+    if data is None:
+        response = care_client.get(
+            f"{settings.CARE_URL}consultation/patient_from_asset/?preset_name=monitor",
+            headers=_get_headers(claims={"asset_id": str(external_id)}),
+        )
+        response.raise_for_status()
+        data = response.json()
+        # an empty bed is looked up again, so a new admission is not missed
+        if data.get("consultation_id"):
+            cache.set(cache_key, data, timeout=settings.PATIENT_LOOKUP_CACHE_TIMEOUT)
     return (
         data.get("consultation_id"),
         data.get("patient_id"),
@@ -74,7 +138,7 @@ def get_patient_id(external_id: UUID):
 
 
 def file_automated_daily_rounds(consultation_id: UUID, asset_id: UUID, vitals: dict):
-    response = requests.post(
+    response = care_client.post(
         f"{settings.CARE_URL}consultation/{consultation_id}/daily_rounds/",
         json=vitals,
         headers=_get_headers(claims={"asset_id": str(asset_id)}),
@@ -86,6 +150,8 @@ def file_automated_daily_rounds(consultation_id: UUID, asset_id: UUID, vitals: d
             consultation_id,
             asset_id,
         )
+        # the consultation may have ended, look the patient up again next time
+        invalidate_patient_ids([asset_id])
         return
     response.raise_for_status()
     logger.info(
@@ -93,9 +159,3 @@ def file_automated_daily_rounds(consultation_id: UUID, asset_id: UUID, vitals: d
         asset_id,
         vitals,
     )
-
-
-def get_current_truncated_utc_z():
-    current_time = datetime.now(pytz.UTC)
-    truncated_time = current_time.replace(second=0, microsecond=0)
-    return truncated_time.strftime("%Y-%m-%dT%H:%M:00.000Z")
@@ -1,15 +1,16 @@
 import requests
 from django.conf import settings
-from django.utils import timezone
 from django.db import connection
 from django.db.utils import OperationalError
 from django.shortcuts import render
+from django.utils import timezone
 from drf_spectacular.utils import extend_schema, extend_schema_view
 from rest_framework import status, viewsets
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 
-from middleware.models import Asset
+from middleware.assets import asset_registry
+from middleware.care import care_client
 from middleware.types import (
     HealthCheckResponse,
     PingResponse,
@@ -65,7 +66,7 @@ class MiddlewareHealthViewSet(viewsets.ViewSet):
     def care_communication_check(self, request):
         try:
             headers = _get_headers()
-            response = requests.get(
+            response = care_client.get(
                 f"{settings.CARE_API}/middleware/verify", headers=headers
             )
             response.raise_for_status()
@@ -85,19 +86,18 @@ class MiddlewareHealthViewSet(viewsets.ViewSet):
         ext_id = request.GET.get("ext_id")
 
         if ip or ext_id:
-            asset = (
-                Asset.objects.filter(deleted=False).filter(ip_address=ip)
-                | Asset.objects.filter(id=ext_id).first()
-            )
+            asset = asset_registry.get_by_ip(ip) if ip else None
+            if asset is None and ext_id:
+                asset = asset_registry.get(ext_id)
         else:
-            asset = Asset.objects.filter(deleted=False).first()
+            asset = next(iter(asset_registry.all()), None)
 
         if asset is None:
             return Response({"error": "No active asset found"}, status=404)
 
         try:
             headers = _get_headers(claims={"asset_id": str(asset.id)})
-            response = requests.get(
+            response = care_client.get(
                 f"{settings.CARE_API}/middleware/verify-asset", headers=headers
             )
             response.raise_for_status()
@@ -122,7 +122,9 @@ def verify_token(request):
         return Response(
             {"error": "no token provided"}, status=status.HTTP_401_UNAUTHORIZED
         )
-    res = requests.post(settings.CARE_VERIFY_TOKEN_URL, data={"token": request.Token})
+    res = care_client.post(
+        settings.CARE_VERIFY_TOKEN_URL, data={"token": request.Token}
+    )
     res.raise_for_status()
     middleware_token = generate_jwt(exp=60 * 20)
     return Response({"token": {middleware_token}}, status=status.HTTP_200_OK)